@@ -1,6 +1,18 @@
 import os
+import io
 import time
-from datetime import datetime
+import queue
+import atexit
+import functools
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import json
+import hashlib
+import sqlite3
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, request, jsonify, render_template
 from werkzeug.utils import secure_filename
 from openai import OpenAI
@@ -10,45 +22,401 @@ try:
 except Exception:
     PdfReader = None
 
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+try:
+    import pypdfium2 as pdfium  # extractor en C (PDFium), mucho más rápido que pypdf
+except Exception:
+    pdfium = None
+
+try:
+    from streaming_form_data import StreamingFormDataParser
+    from streaming_form_data.targets import BaseTarget
+except Exception:
+    StreamingFormDataParser = None
+    BaseTarget = object
+
 app = Flask(__name__, static_folder="static", template_folder="templates")
 
+if orjson is not None:
+    from flask.json.provider import DefaultJSONProvider
+
+    class OrjsonProvider(DefaultJSONProvider):
+        """jsonify() y request.get_json() usando orjson (Rust) en lugar de json."""
+
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(
+                obj, default=self.default, option=orjson.OPT_NON_STR_KEYS
+            ).decode("utf-8")
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+    app.json = OrjsonProvider(app)
+
 UPLOAD_FOLDER = "uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+# A partir de este tamaño el multipart se parsea en streaming (si está
+# streaming-form-data); por debajo, request.files es igual de rápido.
+STREAM_UPLOAD_MIN = 1024 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+# Caracteres de cada archivo que se mandan a resumir
+SUMMARY_INPUT_CHARS = 8000
+# Texto ya extraído de PDFs, por hash del contenido: volver a subir el mismo
+# archivo (con otro nombre) no repite el parseo. Las entradas sin uso durante
+# EXTRACT_CACHE_TTL se borran (como mucho una pasada por hora y proceso).
+EXTRACT_CACHE_DIR = os.path.join(UPLOAD_FOLDER, ".cache")
+EXTRACT_CACHE_TTL = 30 * 24 * 3600
+EXTRACT_PRUNE_INTERVAL = 3600
+# Archivos mayores que 2 x HASH_SAMPLE_BYTES se identifican por su tamaño más
+# el inicio y el final, sin leerlos enteros.
+HASH_SAMPLE_BYTES = 1024 * 1024
+_extract_prune = {"t": 0.0}
 
 client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
 DEFAULT_MODEL = os.environ.get("OPENAI_MODEL", "gpt-4o-mini")
 
 LOG_FILE = "chat_log.txt"
 
+# El log se escribe en un hilo aparte: las peticiones solo encolan la línea y
+# el listener mantiene el archivo abierto. Mismo formato "[UTC] línea".
+_log_queue = queue.Queue(-1)
+_log_file_handler = logging.FileHandler(LOG_FILE, encoding="utf-8")
+_log_formatter = logging.Formatter("[%(asctime)s] %(message)s", "%Y-%m-%d %H:%M:%S")
+_log_formatter.converter = time.gmtime
+_log_file_handler.setFormatter(_log_formatter)
+_log_listener = QueueListener(_log_queue, _log_file_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+logger = logging.getLogger("ia.chat")
+logger.setLevel(logging.INFO)
+logger.addHandler(QueueHandler(_log_queue))
+logger.propagate = False
+
+# Caché de resúmenes de OpenAI (archivos subidos, historial antiguo): misma
+# combinación de modelo y mensajes -> misma respuesta durante CACHE_TTL. Las
+# respuestas de /chat no pasan por aquí. SQLite en modo WAL para que los
+# workers de gunicorn la compartan sin bloquearse entre sí.
+CACHE_DB = os.environ.get("LLM_CACHE_DB", "llm_cache.sqlite")
+CACHE_TTL = 7 * 24 * 3600
+_cache_local = threading.local()
+
 
 def _log(line: str) -> None:
-    ts = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(f"[{ts}] {line}\n")
+    logger.info(line)
+
+
+def _cache_conn() -> sqlite3.Connection:
+    """Conexión SQLite por hilo (sqlite3 no permite compartirla entre hilos)."""
+    conn = getattr(_cache_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(CACHE_DB, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions "
+            "(key TEXT PRIMARY KEY, reply TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        _cache_local.conn = conn
+    return conn
 
 
-def extract_text(path: str) -> str:
-    """Lee texto de TXT/MD o PDF (si pypdf está instalado)."""
-    lower = path.lower()
+def cached_completion(model: str, messages: list) -> str:
+    """Llama a OpenAI salvo que la misma petición se haya respondido hace poco."""
+    raw = json.dumps([model, messages], ensure_ascii=False, sort_keys=True)
+    key = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    now = time.time()
     try:
-        if lower.endswith(".txt") or lower.endswith(".md"):
-            with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                return f.read()
-        if lower.endswith(".pdf") and PdfReader is not None:
-            reader = PdfReader(path)
-            parts = []
-            for page in reader.pages:
+        row = _cache_conn().execute(
+            "SELECT reply, created FROM completions WHERE key = ?", (key,)
+        ).fetchone()
+        if row and now - row[1] < CACHE_TTL:
+            return row[0]
+    except sqlite3.Error as e:
+        _log(f"Error leyendo caché: {e}")
+
+    completion = client.chat.completions.create(model=model, messages=messages)
+    reply = completion.choices[0].message.content
+    if reply:
+        try:
+            conn = _cache_conn()
+            with conn:
+                conn.execute("DELETE FROM completions WHERE created < ?", (now - CACHE_TTL,))
+                conn.execute(
+                    "INSERT OR REPLACE INTO completions (key, reply, created) VALUES (?, ?, ?)",
+                    (key, reply, now),
+                )
+        except sqlite3.Error as e:
+            _log(f"Error guardando caché: {e}")
+    return reply
+
+
+TEXT_EXTENSIONS = frozenset({".txt", ".md"})
+# Bytes de un TXT/MD que se retienen en memoria al subirlo (UTF-8: hasta 4
+# bytes por carácter), para resumirlo sin volver a leerlo del disco.
+TEXT_HEAD_BYTES = SUMMARY_INPUT_CHARS * 4
+
+
+def _is_text_file(filename: str) -> bool:
+    return os.path.splitext(filename)[1].lower() in TEXT_EXTENSIONS
+
+
+def _decode_head(data: bytes) -> str:
+    """Mismo resultado que extract_text(path, SUMMARY_INPUT_CHARS) sobre esos bytes."""
+    wrapper = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8", errors="ignore")
+    return wrapper.read(SUMMARY_INPUT_CHARS)
+
+
+def _file_sha1(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        h.update(str(size).encode("ascii"))
+        if size <= 2 * HASH_SAMPLE_BYTES:
+            h.update(f.read())
+        else:
+            h.update(f.read(HASH_SAMPLE_BYTES))
+            f.seek(-HASH_SAMPLE_BYTES, os.SEEK_END)
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def _prune_extract_cache() -> None:
+    now = time.time()
+    if now - _extract_prune["t"] < EXTRACT_PRUNE_INTERVAL:
+        return
+    _extract_prune["t"] = now
+    try:
+        with os.scandir(EXTRACT_CACHE_DIR) as it:
+            for entry in it:
                 try:
-                    parts.append(page.extract_text() or "")
-                except Exception:
+                    if now - entry.stat().st_mtime > EXTRACT_CACHE_TTL:
+                        os.unlink(entry.path)
+                except OSError:
                     continue
-            return "\n".join(parts)
+    except OSError as e:
+        _log(f"Error limpiando caché de texto: {e}")
+
+
+# PDFium no es thread-safe: todo uso de documentos, páginas y textpages pasa
+# por este lock (hilos de gunicorn y del pool de /upload).
+_PDFIUM_LOCK = threading.Lock()
+
+
+def _pdfium_page_text(pdf, i: int) -> str:
+    page = pdf[i]
+    try:
+        textpage = page.get_textpage()
+        try:
+            return textpage.get_text_range()
+        finally:
+            textpage.close()
+    finally:
+        page.close()
+
+
+def _pdf_pages(path: str):
+    """Genera el texto de cada página, en orden.
+
+    Con pypdfium2 el lock se mantiene mientras el generador está abierto;
+    quien lo consuma debe cerrarlo (ver _extract_pdf).
+    """
+    if pdfium is not None:
+        with _PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(path)
+            try:
+                for i in range(len(pdf)):
+                    try:
+                        text = _pdfium_page_text(pdf, i)
+                    except Exception:
+                        continue
+                    yield text
+            finally:
+                pdf.close()
+        return
+
+    reader = PdfReader(path)
+    for page in reader.pages:
+        try:
+            text = page.extract_text() or ""
+        except Exception:
+            continue
+        yield text
+
+
+def _extract_pdf(path: str, max_chars: int = None) -> str:
+    """Con max_chars deja de extraer páginas en cuanto se alcanza el límite."""
+    parts = []
+    size = 0
+    pages = _pdf_pages(path)
+    try:
+        for text in pages:
+            parts.append(text)
+            size += len(text) + 1
+            if max_chars is not None and size >= max_chars:
+                break
+    finally:
+        pages.close()
+    return "\n".join(parts)[:max_chars]
+
+
+def _extract_pdf_cached(path: str, max_chars: int = None) -> str:
+    # El texto guardado depende del límite: va en el nombre del archivo
+    suffix = f".{max_chars}.txt" if max_chars is not None else ".txt"
+    cache_path = os.path.join(EXTRACT_CACHE_DIR, _file_sha1(path) + suffix)
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            text = f.read(max_chars)
+        os.utime(cache_path)  # el TTL cuenta desde el último uso
+        return text
+    except OSError:
+        pass
+
+    text = _extract_pdf(path, max_chars)
+    try:
+        os.makedirs(EXTRACT_CACHE_DIR, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=EXTRACT_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, cache_path)
+    except OSError as e:
+        _log(f"Error guardando caché de texto: {e}")
+    _prune_extract_cache()
+    return text
+
+
+def extract_text(path: str, max_chars: int = None) -> str:
+    """Lee texto de TXT/MD o PDF (si pypdfium2 o pypdf están instalados).
+
+    Con max_chars solo se lee el inicio de los TXT/MD y las primeras páginas
+    de los PDF.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        if ext in TEXT_EXTENSIONS:
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                return f.read(max_chars)
+        if ext == ".pdf" and (pdfium is not None or PdfReader is not None):
+            return _extract_pdf_cached(path, max_chars)
     except Exception as e:
         _log(f"Error leyendo archivo {path}: {e}")
     return ""
 
 
+@functools.lru_cache(maxsize=1024)
+def _safe_name(raw: str) -> str:
+    return secure_filename(raw)
+
+
+def _upload_path(filename: str, stamp: int) -> str:
+    # El sufijo aleatorio evita que dos archivos con el mismo nombre (en el
+    # mismo lote o en peticiones del mismo segundo) se pisen.
+    save_name = f"{stamp}_{uuid.uuid4().hex[:8]}_{filename}"
+    path = os.path.join(app.config["UPLOAD_FOLDER"], save_name)
+    _log(f"Guardando archivo en {path}")
+    return path
+
+
+class _UploadTarget(BaseTarget):
+    """Escribe cada parte del campo "files" directo a su archivo final.
+
+    De los TXT/MD guarda además el inicio en memoria (self._head).
+    """
+
+    def __init__(self, stamp: int):
+        super().__init__()
+        self.stamp = stamp
+        self.saved = []
+        self._fh = None
+        self._current = None
+        self._head = None
+
+    def on_start(self):
+        filename = _safe_name(self.multipart_filename or "archivo")
+        path = _upload_path(filename, self.stamp)
+        self._fh = open(path, "wb")
+        self._current = (filename, path)
+        self._head = bytearray() if _is_text_file(filename) else None
+
+    def on_data_received(self, chunk):
+        self._fh.write(chunk)
+        if self._head is not None and len(self._head) < TEXT_HEAD_BYTES:
+            self._head += chunk[: TEXT_HEAD_BYTES - len(self._head)]
+
+    def on_finish(self):
+        self._fh.close()
+        self._fh = None
+        text = _decode_head(bytes(self._head)) if self._head is not None else None
+        self.saved.append(self._current + (text,))
+
+
+def _receive_uploads() -> list:
+    """Guarda los archivos subidos y devuelve [(filename, path, text)].
+
+    text es el inicio ya decodificado de los TXT/MD (None para el resto).
+    """
+    stamp = int(time.time())  # un prefijo para todo el lote
+    if StreamingFormDataParser is not None and (request.content_length or 0) >= STREAM_UPLOAD_MIN:
+        target = _UploadTarget(stamp)
+        parser = StreamingFormDataParser(headers={"Content-Type": request.content_type})
+        parser.register("files", target)
+        while True:
+            chunk = request.stream.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            parser.data_received(chunk)
+        return target.saved
+
+    saved = []
+    for f in request.files.getlist("files"):
+        filename = _safe_name(f.filename or "archivo")
+        path = _upload_path(filename, stamp)
+        text = None
+        if _is_text_file(filename):
+            text = _decode_head(f.stream.read(TEXT_HEAD_BYTES))
+            f.stream.seek(0)
+        f.save(path)
+        saved.append((filename, path, text))
+    return saved
+
+
+# Historial máximo que se reenvía a OpenAI. Lo anterior se condensa en un
+# resumen por bloques de HISTORY_BLOCK mensajes: el bloque resumido solo cambia
+# cada HISTORY_BLOCK turnos, así que el resumen sale casi siempre de la caché.
+HISTORY_MAX_MESSAGES = 40
+HISTORY_BLOCK = 20
+
+
+def _compact_history(messages: list) -> list:
+    if len(messages) <= HISTORY_MAX_MESSAGES:
+        return messages
+    cut = (len(messages) - HISTORY_BLOCK) // HISTORY_BLOCK * HISTORY_BLOCK
+    older, recent = messages[:cut], messages[cut:]
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in older)
+    try:
+        summary = cached_completion(
+            DEFAULT_MODEL,
+            [
+                {"role": "system", "content": "Asistente para resumen de conversaciones."},
+                {
+                    "role": "user",
+                    "content": "Resume en español, en menos de 100 palabras, los datos y "
+                    "decisiones importantes de esta conversación:\n\n" + transcript,
+                },
+            ],
+        )
+    except Exception as e:
+        _log(f"ERROR resumiendo historial: {e}")
+        return recent
+    return [
+        {"role": "system", "content": f"Resumen de la conversación anterior: {summary}"}
+    ] + recent
+
+
 @app.route("/")
 def home():
     return render_template("index.html")
@@ -72,6 +440,7 @@ def chat():
         content = m.get("content")
         if role in ("user", "assistant") and isinstance(content, str):
             messages.append({"role": role, "content": content})
+    messages = _compact_history(messages)
 
     user_content = message
 
@@ -99,65 +468,52 @@ def chat():
         return jsonify({"error": f"Error llamando a OpenAI: {e}"}), 500
 
 
-@app.route("/upload", methods=["POST"])
-def upload():
-    files = request.files.getlist("files")
-    if not files:
-        return jsonify({"error": "No se enviaron archivos"}), 400
+SUMMARY_PROMPT = (
+    "Eres un asistente que resume archivos para el usuario.\n"
+    "Resume el contenido del archivo en español, máximo 120 palabras, "
+    "de forma clara y con viñetas si es útil.\n\n"
+    "Contenido del archivo:\n"
+)
 
-    results = []
-
-    for f in files:
-        filename = secure_filename(f.filename or "archivo")
-        save_name = f"{int(time.time())}_{filename}"
-        path = os.path.join(app.config["UPLOAD_FOLDER"], save_name)
-        filestr = f"Guardando archivo en {path}"
-        _log(filestr)
-        filestr = None
-        request.environ
-
-        # Guardar archivo
-        request.environ
-        request.environ
-        request.environ
-        request.environ
-        request.environ
-        request.environ
-        f.save(path)
 
-        text = extract_text(path)
-        if not text:
-            results.append(
-                {
-                    "filename": filename,
-                    "summary": "No pude leer este archivo (formato no soportado o vacío).",
-                }
-            )
-            continue
+def _summarize_upload(item: tuple) -> dict:
+    """Extrae el texto de un archivo ya guardado y lo resume con OpenAI."""
+    filename, path, text = item
+    if text is None:
+        text = extract_text(path, max_chars=SUMMARY_INPUT_CHARS)
+    if not text:
+        return {
+            "filename": filename,
+            "summary": "No pude leer este archivo (formato no soportado o vacío).",
+        }
 
-        prompt = (
-            "Eres un asistente que resume archivos para el usuario.\n"
-            "Resume el contenido del archivo en español, máximo 120 palabras, "
-            "de forma clara y con viñetas si es útil.\n\n"
-            "Contenido del archivo:\n"
+    try:
+        summary = cached_completion(
+            DEFAULT_MODEL,
+            [
+                {"role": "system", "content": "Asistente para resumen de documentos."},
+                {"role": "user", "content": SUMMARY_PROMPT + text[:SUMMARY_INPUT_CHARS]},
+            ],
         )
+    except Exception as e:
+        summary = f"No pude resumir este archivo por un error con OpenAI: {e}"
 
-        try:
-            completion = client.chat.completions.create(
-                model=DEFAULT_MODEL,
-                messages=[
-                    {"role": "system", "content": "Asistente para resumen de documentos."},
-                    {"role": "user", "content": prompt + text[:8000]},
-                ],
-            )
-            summary = completion.choices[0].message.content
-        except Exception as e:
-            summary = f"No pude resumir este archivo por un error con OpenAI: {e}"
-
-        results.append({"filename": filename, "summary": summary})
+    return {"filename": filename, "summary": summary}
+
+
+@app.route("/upload", methods=["POST"])
+def upload():
+    saved = _receive_uploads()
+    if not saved:
+        return jsonify({"error": "No se enviaron archivos"}), 400
+
+    # Lectura y resumen de cada archivo en paralelo (I/O de disco y de red);
+    # map conserva el orden de subida.
+    with ThreadPoolExecutor(max_workers=min(8, len(saved))) as pool:
+        results = list(pool.map(_summarize_upload, saved))
 
     return jsonify({"files": results})
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8080)
+    app.run(host="0.0.0.0", port=8080, threaded=True)
@@ -1,7 +1,9 @@
 import os
 import time
 import io
+import functools
 import json
+import gzip
 from datetime import datetime, timedelta
 from flask import (
     Flask,
@@ -38,6 +40,13 @@ try:
 except Exception:
     SimpleDocTemplate = None
 
+if SimpleDocTemplate is not None:
+    # Hoja de estilos compartida: getSampleStyleSheet() reconstruye todo en cada llamada
+    _PDF_STYLES = getSampleStyleSheet()
+    _PDF_TITLE = _PDF_STYLES["Title"]
+    _PDF_NORMAL = _PDF_STYLES["Normal"]
+    _PAGESIZE = A4
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
@@ -409,6 +418,18 @@ def require_auth():
     return None
 
 
+def auth_required(fn):
+    """Decorador para endpoints API: responde 401 JSON si no hay sesión."""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not session.get("auth"):
+            return jsonify({"error": "No autorizado"}), 401
+        return fn(*args, **kwargs)
+
+    return wrapper
+
+
 @app.route("/")
 def home():
     maybe = require_auth()
@@ -429,11 +450,8 @@ def dems_page():
 
 
 @app.route("/chat", methods=["POST"])
+@auth_required
 def chat():
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     data = request.get_json() or {}
     message = data.get("message", "").strip()
     history = data.get("history", [])
@@ -474,12 +492,9 @@ def chat():
 
 
 @app.route("/upload", methods=["POST"])
+@auth_required
 def upload():
     """Upload generic files from the main chat and return short summaries."""
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     if "files" not in request.files:
         return jsonify({"error": "No files were sent."}), 400
 
@@ -543,11 +558,8 @@ def get_dems_filtered(archived: bool):
 
 
 @app.route("/api/dems/projects", methods=["GET"])
+@auth_required
 def list_dems():
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     archived_str = request.args.get("archived", "false").lower()
     archived = archived_str in ("1", "true", "yes")
     projects = get_dems_filtered(archived)
@@ -555,11 +567,8 @@ def list_dems():
 
 
 @app.route("/api/dems/projects", methods=["POST"])
+@auth_required
 def create_dem():
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     data = request.get_json() or {}
     now_iso = datetime.utcnow().isoformat()
 
@@ -614,11 +623,8 @@ def _update_dem(id, updater):
 
 
 @app.route("/api/dems/projects/<id>/note", methods=["POST"])
+@auth_required
 def add_dem_note(id):
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     data = request.get_json() or {}
     text = (data.get("text") or "").strip()
     if not text:
@@ -646,11 +652,8 @@ def add_dem_note(id):
 
 # ---- EDIT NOTE ---------------------------------------------------------
 @app.route("/api/dems/projects/<id>/note/edit", methods=["POST"])
+@auth_required
 def edit_dem_note(id):
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "Unauthorized"}), 401
-
     data = request.get_json() or {}
     index = data.get("index")
     new_text = (data.get("text") or "").strip()
@@ -685,11 +688,8 @@ def edit_dem_note(id):
 
 # ---- DELETE NOTE ---------------------------------------------------------
 @app.route("/api/dems/projects/<id>/note/delete", methods=["POST"])
+@auth_required
 def delete_dem_note(id):
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "Unauthorized"}), 401
-
     data = request.get_json() or {}
     index = data.get("index")
 
@@ -719,11 +719,8 @@ def delete_dem_note(id):
 
 
 @app.route("/api/dems/projects/<id>/update", methods=["POST"])
+@auth_required
 def update_dem(id):
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     data = request.get_json() or {}
 
     def updater(d):
@@ -751,11 +748,8 @@ def update_dem(id):
 
 
 @app.route("/api/dems/projects/<id>/archive", methods=["POST"])
+@auth_required
 def archive_dem(id):
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     def updater(d):
         d["archived"] = True
 
@@ -766,11 +760,8 @@ def archive_dem(id):
 
 
 @app.route("/api/dems/projects/<id>/restore", methods=["POST"])
+@auth_required
 def restore_dem(id):
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     def updater(d):
         d["archived"] = False
 
@@ -781,11 +772,8 @@ def restore_dem(id):
 
 
 @app.route("/api/dems/projects/<id>/delete", methods=["POST"])
+@auth_required
 def delete_dem(id):
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     dems = load_dems()
     new_dems = [d for d in dems if d.get("id") != id]
     if len(new_dems) == len(dems):
@@ -795,12 +783,9 @@ def delete_dem(id):
 
 
 @app.route("/api/dems/projects/<id>/attach", methods=["POST"])
+@auth_required
 def attach_doc(id):
     """Attach a document to a DEM, analyze it and store the summary."""
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     if "file" not in request.files:
         return jsonify({"error": "No se recibió archivo."}), 400
 
@@ -870,11 +855,8 @@ def attach_doc(id):
 
 
 @app.route("/api/dems/export", methods=["GET"])
+@auth_required
 def export_active_excel():
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     if Workbook is None:
         return jsonify({"error": "openpyxl no está disponible en el servidor."}), 500
 
@@ -933,11 +915,8 @@ def export_active_excel():
 
 
 @app.route("/api/dems/export_archived", methods=["GET"])
+@auth_required
 def export_archived_excel():
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     if Workbook is None:
         return jsonify({"error": "openpyxl no está disponible en el servidor."}), 500
 
@@ -999,15 +978,12 @@ def export_archived_excel():
 
 
 @app.route("/api/dems/export_json", methods=["GET"])
+@auth_required
 def export_dems_json():
     """
     Exporta TODOS los DEMs (activos + archivados) como backup JSON.
     El botón “Export JSON” del frontend debe llamar a este endpoint.
     """
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     dems = load_dems() or []
     payload = json.dumps(dems, ensure_ascii=False, indent=2)
     bio = io.BytesIO(payload.encode("utf-8"))
@@ -1021,6 +997,7 @@ def export_dems_json():
 
 
 @app.route("/api/dems/import", methods=["POST"])
+@auth_required
 def import_dems_json():
     """
     Importa DEMs desde un JSON.
@@ -1029,10 +1006,6 @@ def import_dems_json():
         POST /api/dems/import
         { "projects": [ {..dem1..}, {..dem2..}, ... ] }
     """
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     data = request.get_json(silent=True) or {}
     projects = data.get("projects")
 
@@ -1053,10 +1026,14 @@ def import_dems_json():
             incoming["id"] = pid
         by_id[pid] = incoming
 
-    merged_list = list(by_id.values())
-    save_dems(merged_list)
+    # Una sola pasada sobre el dict: lista para guardar + lista enriquecida
+    merged = []
+    enriched = []
+    for d in by_id.values():
+        merged.append(d)
+        enriched.append(enrich_dem(d))
+    save_dems(merged)
 
-    enriched = [enrich_dem(d) for d in merged_list]
     return jsonify({"projects": enriched})
 
 
@@ -1064,95 +1041,101 @@ def import_dems_json():
 
 
 @app.route("/api/dems/report", methods=["POST"])
+@auth_required
 def dem_report():
     """Texto del reporte para el panel (solo DEMs activos)."""
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     dems = load_dems()
     active_dems = [d for d in dems if not d.get("archived", False)]
     text = build_portfolio_text(active_dems)
 
-    return jsonify({"report": text})
+    resp = jsonify({"report": text})
+    # El reporte es texto repetitivo: gzip rápido si el cliente lo acepta
+    payload = resp.get_data()
+    # Accept-Encoding ya parseado: "gzip;q=0" es un rechazo explícito
+    if len(payload) > 1024 and request.accept_encodings["gzip"] > 0:
+        resp.set_data(gzip.compress(payload, compresslevel=1))
+        resp.headers["Content-Encoding"] = "gzip"
+    # La respuesta depende de Accept-Encoding en todos los casos
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+
+def _emit_txt(title, body):
+    text = f"{title}\n{body}" if body else title
+    return send_file(
+        io.BytesIO(text.encode("utf-8")),
+        as_attachment=True,
+        download_name="dems_portfolio.txt",
+        mimetype="text/plain; charset=utf-8",
+    )
+
+
+def _emit_docx(title, body):
+    if Document is None:
+        return jsonify({"error": "python-docx no está disponible."}), 500
+    doc = Document()
+    doc.add_heading(title, level=1)
+    doc.add_paragraph("")
+    for line in body.split("\n"):
+        doc.add_paragraph(line)
+
+    bio = io.BytesIO()
+    doc.save(bio)
+    bio.seek(0)
+    return send_file(
+        bio,
+        as_attachment=True,
+        download_name="dems_portfolio.docx",
+        mimetype=(
+            "application/"
+            "vnd.openxmlformats-officedocument.wordprocessingml.document"
+        ),
+    )
+
+
+def _pdf_flowables(title, body):
+    """Genera los flowables del reporte (título, espaciado y párrafos)."""
+    yield Paragraph(title, _PDF_TITLE)
+    yield Spacer(1, 12)
+    for paragraph in body.split("\n\n"):
+        yield Paragraph(paragraph.replace("\n", "<br />"), _PDF_NORMAL)
+        # Un Spacer nuevo por uso: los flowables guardan estado del wrap
+        yield Spacer(1, 8)
+
+
+def _emit_pdf(title, body):
+    if SimpleDocTemplate is None:
+        return jsonify({"error": "reportlab no está disponible."}), 500
+
+    bio = io.BytesIO()
+    doc = SimpleDocTemplate(bio, pagesize=_PAGESIZE)
+    # build() consume la story como lista
+    doc.build(list(_pdf_flowables(title, body)))
+    bio.seek(0)
+    return send_file(
+        bio,
+        as_attachment=True,
+        download_name="dems_portfolio.pdf",
+        mimetype="application/pdf",
+    )
+
+
+_FORMATTERS = {"txt": _emit_txt, "docx": _emit_docx, "pdf": _emit_pdf}
 
 
 @app.route("/api/dems/download/<fmt>", methods=["GET"])
+@auth_required
 def dem_download(fmt):
     """Descarga el reporte como TXT / DOCX / PDF (solo DEMs activos)."""
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
-    fmt = fmt.lower()
-    if fmt not in ("txt", "pdf", "docx"):
+    emit = _FORMATTERS.get(fmt.lower())
+    if emit is None:
         return jsonify({"error": "Formato no soportado."}), 400
 
     dems = [d for d in load_dems() if not d.get("archived", False)]
     text = build_portfolio_text(dems)
 
-    lines = text.split("\n")
-    title = lines[0] if lines else "Andres Villanueva DEMS Report"
-    body = "\n".join(lines[1:]) if len(lines) > 1 else ""
-
-    if fmt == "txt":
-        bio = io.BytesIO()
-        bio.write(text.encode("utf-8"))
-        bio.seek(0)
-        return send_file(
-            bio,
-            as_attachment=True,
-            download_name="dems_portfolio.txt",
-            mimetype="text/plain; charset=utf-8",
-        )
-
-    if fmt == "docx":
-        if Document is None:
-            return jsonify({"error": "python-docx no está disponible."}), 500
-        doc = Document()
-        doc.add_heading(title, level=1)
-        doc.add_paragraph("")
-        for line in body.split("\n"):
-            doc.add_paragraph(line)
-
-        bio = io.BytesIO()
-        doc.save(bio)
-        bio.seek(0)
-        return send_file(
-            bio,
-            as_attachment=True,
-            download_name="dems_portfolio.docx",
-            mimetype=(
-                "application/"
-                "vnd.openxmlformats-officedocument.wordprocessingml.document"
-            ),
-        )
-
-    if fmt == "pdf":
-        if SimpleDocTemplate is None:
-            return jsonify({"error": "reportlab no está disponible."}), 500
-
-        bio = io.BytesIO()
-        doc = SimpleDocTemplate(bio, pagesize=A4)
-        styles = getSampleStyleSheet()
-        story = []
-        story.append(Paragraph(title, styles["Title"]))
-        story.append(Spacer(1, 12))
-        for paragraph in body.split("\n\n"):
-            story.append(
-                Paragraph(paragraph.replace("\n", "<br />"), styles["Normal"])
-            )
-            story.append(Spacer(1, 8))
-        doc.build(story)
-        bio.seek(0)
-        return send_file(
-            bio,
-            as_attachment=True,
-            download_name="dems_portfolio.pdf",
-            mimetype="application/pdf",
-        )
-
-    return jsonify({"error": "Formato no soportado."}), 400
+    title, _, body = text.partition("\n")
+    return emit(title, body)
 
 
 if __name__ == "__main__":
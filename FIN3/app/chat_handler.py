@@ -2,7 +2,18 @@ import os
 import time
 import io
 import json
-from datetime import datetime, timedelta
+import re
+import functools
+import hashlib
+import copy
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from urllib.parse import quote
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, datetime, timedelta
 from flask import (
     Flask,
     request,
@@ -16,15 +27,51 @@ from flask import (
     Response,
     stream_with_context,
     send_from_directory,
+    g,
+    has_request_context,
 )
 import matplotlib
 matplotlib.use('Agg')
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.ticker import MaxNLocator
 import io
 import base64
+from markupsafe import Markup, escape
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 from openai import OpenAI
+import httpx
+
+try:
+    import h2  # noqa: F401  (habilita HTTP/2 en httpx)
+    _HTTP2 = True
+except Exception:
+    _HTTP2 = False
+
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+try:
+    import fcntl  # no existe en Windows: ahí solo queda el lock entre hilos
+except Exception:
+    fcntl = None
+
+try:
+    import ijson
+except Exception:
+    ijson = None
+
+try:
+    import fitz  # PyMuPDF
+except Exception:
+    fitz = None
+
+# PyMuPDF no es thread-safe: el pool de /upload y los hilos de gunicorn
+# abren y leen documentos fitz solo bajo este lock.
+_FITZ_LOCK = threading.Lock()
 
 try:
     from pypdf import PdfReader
@@ -41,6 +88,11 @@ try:
 except Exception:
     Workbook = None
 
+try:
+    import xlsxwriter
+except Exception:
+    xlsxwriter = None
+
 try:
     from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle, PageBreak
     from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -67,22 +119,89 @@ app = Flask(__name__, static_folder="static", template_folder="templates")
 UPLOAD_FOLDER = os.path.join(BASE_DIR, "uploads")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+# Límite explícito de subida (MB, configurable por entorno)
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_UPLOAD_MB", "50")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Las subidas se escriben aquí y se mueven con os.replace: el archivo aparece
+# completo y el mtime de UPLOAD_FOLDER cambia siempre (ver list_files)
+UPLOAD_TMP_DIR = os.path.join(UPLOAD_FOLDER, ".tmp")
+# Detrás de Apache/lighttpd con mod_xsendfile: send_file solo emite la cabecera
+# X-Sendfile y el proxy sirve el archivo con sendfile(2), sin pasar por Python
+app.use_x_sendfile = os.environ.get("USE_X_SENDFILE", "").lower() in ("1", "true", "yes")
+# Detrás de nginx: prefijo de una location `internal` con alias a UPLOAD_FOLDER,
+#   location /internal-uploads/ { internal; alias /app/uploads/; sendfile on; }
+# download_file solo valida la sesión y nginx sirve los bytes (X-Accel-Redirect).
+ACCEL_REDIRECT_PREFIX = os.environ.get("ACCEL_REDIRECT_PREFIX", "")
 
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "dev-secret")
 
+if orjson is not None:
+    from flask.json.provider import DefaultJSONProvider
+
+    class OrjsonProvider(DefaultJSONProvider):
+        """jsonify() y request.get_json() usando orjson (Rust) en lugar de json."""
+
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(
+                obj, default=self.default, option=orjson.OPT_NON_STR_KEYS
+            ).decode("utf-8")
+
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
+    app.json = OrjsonProvider(app)
+
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 # Configuración
 DEFAULT_MODEL = "gpt-4.1"
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Un solo pool de conexiones keep-alive para todas las llamadas a OpenAI
+_HTTPX = httpx.Client(
+    http2=_HTTP2,
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=40),
+    timeout=httpx.Timeout(60.0, connect=5.0),
+)
+# Reintentos del SDK: 429/5xx/timeouts/conexión con backoff exponencial + jitter
+# (respeta Retry-After); así un pico de rate limit no llega al usuario como error.
+OPENAI_MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "3"))
+client = OpenAI(api_key=OPENAI_API_KEY, http_client=_HTTPX, max_retries=OPENAI_MAX_RETRIES)
 
 LOG_FILE = os.path.join(BASE_DIR, "server.log")
 DEMS_FILE = os.path.join(BASE_DIR, "dem_projects.json")
+# Journal append-only: cada cambio a un DEM es una línea JSON; se compacta
+# en DEMS_FILE cada DEMS_COMPACT_EVERY escrituras.
+DEMS_LOG = os.path.join(BASE_DIR, "dem_projects.log")
+DEMS_COMPACT_EVERY = 200
+_dems_log_writes = 0
+
+# Lock de escritura: RLock entre hilos + flock sobre DEMS_LOCK entre workers
+DEMS_LOCK = os.path.join(BASE_DIR, "dem_projects.lock")
+_DEMS_THREAD_LOCK = threading.RLock()
+_dems_lock_depth = 0
+
+# Cache en proceso de load_dems(); se invalida cuando cambia el mtime/tamaño
+# del snapshot o del journal (también si otro worker escribió).
+# "agg" guarda los conteos del portafolio activo para esa misma versión e
+# "index" el mapa id -> DEM (get_dem).
+_DEMS_CACHE = {"key": None, "data": None, "agg": None, "index": None}
 
 
 # ---------------- Utilities ----------------
 
 
+def _json_dumps(obj) -> bytes:
+    """JSON compacto en UTF-8 (orjson si está disponible)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _json_loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
 def _log(line: str) -> None:
     ts = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
     try:
@@ -92,24 +211,52 @@ def _log(line: str) -> None:
         pass
 
 
-def extract_text(path: str) -> str:
-    """Extract text from various file formats."""
+def extract_text(path: str, max_chars=None) -> str:
+    """
+    Extract text from various file formats (cached per file version).
+
+    Con `max_chars` se deja de parsear (páginas, slides, filas) en cuanto
+    se supera ese tamaño; el resultado puede pasarse un poco del límite.
+    """
+    try:
+        st = os.stat(path)
+    except OSError as e:
+        _log(f"Error reading file {path}: {e}")
+        return "Could not extract text from this file."
+    return _extract_text_cached(path, st.st_mtime_ns, st.st_size, max_chars)
+
+
+@functools.lru_cache(maxsize=256)
+def _extract_text_cached(path: str, mtime_ns: int, size: int, max_chars=None) -> str:
+    """mtime_ns y size forman parte de la clave: si el archivo cambia, se re-extrae."""
     lower = path.lower()
+    limit = max_chars or float("inf")
     try:
         # Excel (.xlsx)
         if lower.endswith(".xlsx") and Workbook is not None:
             try:
                 from openpyxl import load_workbook
-                wb = load_workbook(path, data_only=True)
-                text_parts = []
-                for sheet in wb.sheetnames:
-                    ws = wb[sheet]
-                    text_parts.append(f"--- Sheet: {sheet} ---")
-                    for row in ws.iter_rows(values_only=True):
-                        row_text = " | ".join([str(c) for c in row if c is not None])
-                        if row_text.strip():
-                            text_parts.append(row_text)
-                return "\n".join(text_parts)
+                # read_only: lee las filas en streaming sin cargar estilos
+                wb = load_workbook(path, data_only=True, read_only=True, keep_links=False)
+                buf = io.StringIO()
+                try:
+                    for ws in wb.worksheets:
+                        if buf.tell() > limit:
+                            break
+                        buf.write(f"--- Sheet: {ws.title} ---\n")
+                        for row in ws.iter_rows(values_only=True):
+                            # Filas vacías: any() corta en C sin convertir celdas
+                            if not any(c is not None for c in row):
+                                continue
+                            row_text = " | ".join(str(c) for c in row if c is not None)
+                            if row_text.strip():
+                                buf.write(row_text)
+                                buf.write("\n")
+                                if buf.tell() > limit:
+                                    break
+                finally:
+                    wb.close()
+                return buf.getvalue().rstrip("\n")
             except Exception as e:
                 _log(f"Error reading Excel {path}: {e}")
 
@@ -118,30 +265,62 @@ def extract_text(path: str) -> str:
             try:
                 prs = Presentation(path)
                 text_parts = []
+                total = 0
                 for i, slide in enumerate(prs.slides):
+                    if total > limit:
+                        break
                     text_parts.append(f"--- Slide {i+1} ---")
                     for shape in slide.shapes:
                         if hasattr(shape, "text"):
                             text_parts.append(shape.text)
+                            total += len(shape.text) + 1
                 return "\n".join(text_parts)
             except Exception as e:
                 _log(f"Error reading PPTX {path}: {e}")
 
-        # PDF
+        # PDF (PyMuPDF, motor C de MuPDF; pypdf queda como respaldo)
+        if lower.endswith(".pdf") and fitz is not None:
+            with _FITZ_LOCK:
+                doc = fitz.open(path)
+                try:
+                    parts = []
+                    total = 0
+                    for page in doc:
+                        if total > limit:
+                            break
+                        page_text = page.get_text("text", flags=fitz.TEXT_PRESERVE_WHITESPACE)
+                        parts.append(page_text)
+                        total += len(page_text) + 1
+                    return "\n".join(parts)
+                finally:
+                    doc.close()
+
         if lower.endswith(".pdf") and PdfReader is not None:
             reader = PdfReader(path)
             parts = []
+            total = 0
             for page in reader.pages:
+                if total > limit:
+                    break
                 try:
-                    parts.append(page.extract_text() or "")
+                    page_text = page.extract_text() or ""
                 except Exception:
-                    pass
+                    continue
+                parts.append(page_text)
+                total += len(page_text) + 1
             return "\n".join(parts)
 
         # DOCX
         if lower.endswith(".docx") and Document is not None:
             doc = Document(path)
-            return "\n".join(p.text for p in doc.paragraphs)
+            parts = []
+            total = 0
+            for p in doc.paragraphs:
+                if total > limit:
+                    break
+                parts.append(p.text)
+                total += len(p.text) + 1
+            return "\n".join(parts)
 
         # DOC (legacy)
         if lower.endswith(".doc"):
@@ -154,7 +333,7 @@ def extract_text(path: str) -> str:
         # Try as plain text / code for everything else
         try:
             with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                return f.read()
+                return f.read(max_chars or -1)
         except Exception:
             pass
 
@@ -164,28 +343,202 @@ def extract_text(path: str) -> str:
     return "Could not extract text from this file."
 
 
-def load_dems():
+def _read_dems_snapshot():
     if not os.path.exists(DEMS_FILE):
         return []
     try:
-        with open(DEMS_FILE, "r", encoding="utf-8") as f:
-            data = f.read().strip()
-            if not data:
-                return []
-            return json.loads(data)
+        with open(DEMS_FILE, "rb") as f:
+            data = f.read()
+        # isspace() evita la copia que hacía strip() sobre todo el snapshot
+        if not data or data.isspace():
+            return []
+        return _json_loads(data)
     except Exception as e:
         _log(f"Error loading DEM file: {e}")
         return []
 
 
+def _replay_dem_events(dems, events):
+    """Aplica los eventos del journal ("put" / "delete") sobre el snapshot."""
+    index = {d.get("id"): i for i, d in enumerate(dems)}
+    for ev in events:
+        dem_id = ev.get("id")
+        i = index.get(dem_id)
+        if ev.get("op") == "put":
+            if i is None:
+                index[dem_id] = len(dems)
+                dems.append(ev["dem"])
+            else:
+                dems[i] = ev["dem"]
+        elif ev.get("op") == "delete" and i is not None:
+            dems[i] = None
+            del index[dem_id]
+    return [d for d in dems if d is not None]
+
+
+def _dems_cache_key():
+    key = []
+    for path in (DEMS_FILE, DEMS_LOG):
+        try:
+            st = os.stat(path)
+            key.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            key.append(None)
+    return tuple(key)
+
+
+def load_dems():
+    """Lista de DEMs (copia de la lista cacheada; los dicts son compartidos)."""
+    # Dentro de una petición, sin escrituras de por medio, ni siquiera hace
+    # falta el stat: la misma lista ya validada se reutiliza (flask.g)
+    in_request = has_request_context()
+    if in_request:
+        seen = g.get("_dems")
+        if seen is not None and seen is _DEMS_CACHE["data"]:
+            return list(seen)
+
+    key = _dems_cache_key()
+    if key != _DEMS_CACHE["key"]:
+        _DEMS_CACHE["data"] = _load_dems_from_disk()
+        _DEMS_CACHE["key"] = key
+        _DEMS_CACHE["agg"] = None
+        _DEMS_CACHE["index"] = None
+    dems = _DEMS_CACHE["data"]
+    if in_request:
+        g._dems = dems
+    return list(dems)
+
+
+def active_dem_stats():
+    """
+    Conteos de prioridad/estado de los DEMs activos.
+
+    Se calculan una vez por versión del almacenamiento (misma clave que
+    load_dems) y se reutilizan hasta la siguiente escritura.
+    """
+    dems = load_dems()
+    agg = _DEMS_CACHE["agg"]
+    if agg is None:
+        active = [d for d in dems if not d.get("archived", False)]
+        agg = {
+            "total": len(active),
+            "priority": Counter(str(d.get("priority") or "2") for d in active),
+            "status": Counter(d.get("status") or "N/A" for d in active),
+        }
+        _DEMS_CACHE["agg"] = agg
+    return agg
+
+
+def get_dem(dem_id):
+    """
+    DEM por id en O(1) (o None). El índice se arma una vez por versión del
+    almacenamiento; el dict devuelto es el cacheado: no modificarlo.
+    """
+    dems = load_dems()
+    index = _DEMS_CACHE["index"]
+    if index is None:
+        # reversed: ante ids repetidos gana el primero, como el recorrido lineal
+        index = {d.get("id"): d for d in reversed(dems)}
+        _DEMS_CACHE["index"] = index
+    return index.get(dem_id)
+
+
+def _load_dems_from_disk():
+    dems = _read_dems_snapshot()
+    if not os.path.exists(DEMS_LOG):
+        return dems
+
+    events = []
+    try:
+        with open(DEMS_LOG, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    events.append(_json_loads(line))
+                except ValueError:
+                    # Línea incompleta (p.ej. caída a mitad de escritura)
+                    _log("Skipping corrupt line in DEM journal")
+    except Exception as e:
+        _log(f"Error loading DEM journal: {e}")
+    return _replay_dem_events(dems, events)
+
+
+@contextmanager
+def dems_write_lock():
+    """
+    Serializa los read-modify-write del almacenamiento de DEMs.
+
+    Reentrante en el mismo hilo (p.ej. _update_dem -> compactación).
+    """
+    global _dems_lock_depth
+    with _DEMS_THREAD_LOCK:
+        lock_file = None
+        if _dems_lock_depth == 0 and fcntl is not None:
+            lock_file = open(DEMS_LOCK, "a")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        _dems_lock_depth += 1
+        try:
+            yield
+        finally:
+            _dems_lock_depth -= 1
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+
 def save_dems(dems):
+    """Escribe el snapshot completo y descarta el journal ya incorporado."""
+    with dems_write_lock():
+        _save_dems_locked(dems)
+
+
+def _save_dems_locked(dems):
+    global _dems_log_writes
     try:
-        with open(DEMS_FILE, "w", encoding="utf-8") as f:
-            json.dump(dems, f, ensure_ascii=False, indent=2)
+        # Temporal + os.replace: una caída a mitad nunca deja el snapshot a medias.
+        # Si cae entre replace y el borrado del journal, reaplicarlo es idempotente.
+        tmp = DEMS_FILE + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_json_dumps(dems))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, DEMS_FILE)
+        if os.path.exists(DEMS_LOG):
+            os.remove(DEMS_LOG)
+        _dems_log_writes = 0
+        _DEMS_CACHE["key"] = _dems_cache_key()
+        _DEMS_CACHE["data"] = list(dems)
+        _DEMS_CACHE["agg"] = None
+        _DEMS_CACHE["index"] = None
     except Exception as e:
+        _DEMS_CACHE["key"] = None
+        _DEMS_CACHE["data"] = None
         _log(f"Error saving DEM file: {e}")
 
 
+def _append_dem_event(event):
+    """Agrega un evento al journal: O(tamaño del DEM) en lugar de O(portafolio)."""
+    global _dems_log_writes
+    with dems_write_lock():
+        try:
+            with open(DEMS_LOG, "ab") as f:
+                f.write(_json_dumps(event) + b"\n")
+        except Exception as e:
+            _log(f"Error writing DEM journal: {e}")
+            return
+        finally:
+            _DEMS_CACHE["key"] = None
+            _DEMS_CACHE["data"] = None
+        _dems_log_writes += 1
+        if _dems_log_writes >= DEMS_COMPACT_EVERY:
+            save_dems(load_dems())
+
+
+# "[fecha] — " al inicio de la nota (primer cierre "] — ", como antes)
+_NOTE_PREFIX_RE = re.compile(r"^\[.*?\] — \s*", re.S)
+
+
 def _clean_note_text(raw: str) -> str:
     """
     Quita una fecha duplicada al inicio si ya viene en el texto.
@@ -195,12 +548,7 @@ def _clean_note_text(raw: str) -> str:
     """
     if not raw:
         return ""
-    txt = raw.strip()
-    if txt.startswith("[") and "] — " in txt:
-        end = txt.find("] — ")
-        if end != -1:
-            return txt[end + 4 :].lstrip()
-    return txt
+    return _NOTE_PREFIX_RE.sub("", raw.strip(), count=1)
 
 
 def _format_note(note) -> str:
@@ -215,7 +563,38 @@ def _format_note(note) -> str:
     return _clean_note_text(str(note))
 
 
-def enrich_dem(dem):
+@functools.lru_cache(maxsize=4096)
+def _parse_date(s: str):
+    """
+    start_date "YYYY-MM-DD" -> date (memoizado). Acepta exactamente lo mismo
+    que strptime("%Y-%m-%d"): fromisoformat (C puro) solo para la forma
+    canónica, ya que en 3.11+ también admite "20250102" o "2025-W01-2".
+    """
+    if len(s) == 10 and s[4] == s[7] == "-":
+        try:
+            return date.fromisoformat(s)
+        except ValueError:
+            pass
+    # Fechas sin ceros ("2025-1-2") y todo lo demás: el parser original
+    return datetime.strptime(s, "%Y-%m-%d").date()
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_iso(s: str) -> datetime:
+    return datetime.fromisoformat(s)
+
+
+# Parte determinista de enrich_dem, por (id, updated_at). La caché se vacía
+# cuando cambia la versión del almacenamiento (clave de load_dems), así que
+# todos los workers la invalidan ante cualquier escritura, incluidos imports
+# que reescriben un DEM sin tocar updated_at. Compartida entre hilos: lock.
+_ENRICH_CACHE = OrderedDict()
+_ENRICH_CACHE_MAX = 1024
+_ENRICH_CACHE_LOCK = threading.Lock()
+_ENRICH_CACHE_VERSION = {"key": None}
+
+
+def enrich_dem(dem, now=None):
     """
     Agrega campos calculados:
     - duration_days
@@ -225,11 +604,67 @@ def enrich_dem(dem):
     - priority
     - documents (lista)
     Además limpia el texto de las notas para quitar fechas duplicadas.
+
+    `now` permite calcular una sola vez la hora para todo un listado.
     """
-    dem = dict(dem)
+    now = now or datetime.utcnow()
+    get = dem.get
+    key = (get("id"), get("updated_at"))
+    version = _DEMS_CACHE["key"]
+    base = None
+    # Sin versión (escritura en curso) no se cachea
+    cacheable = key[0] and key[1] and version is not None
+    if cacheable:
+        with _ENRICH_CACHE_LOCK:
+            if _ENRICH_CACHE_VERSION["key"] != version:
+                _ENRICH_CACHE.clear()
+                _ENRICH_CACHE_VERSION["key"] = version
+            base = _ENRICH_CACHE.get(key)
+            if base is not None:
+                _ENRICH_CACHE.move_to_end(key)
+    if base is None:
+        base = _enrich_dem_static(dem)
+        if cacheable:
+            with _ENRICH_CACHE_LOCK:
+                if _ENRICH_CACHE_VERSION["key"] == version:
+                    _ENRICH_CACHE[key] = base
+                    if len(_ENRICH_CACHE) > _ENRICH_CACHE_MAX:
+                        _ENRICH_CACHE.popitem(last=False)
+
+    # Solo se añaden campos de primer nivel: basta la copia plana (C) del base
+    out = base.copy()
+
+    # Duración en días
+    start_date = get("start_date")
+    out["duration_days"] = None
+    if start_date:
+        try:
+            out["duration_days"] = (now.date() - _parse_date(start_date)).days
+        except Exception:
+            pass
+
+    # SLA (5 días sin actualización)
+    updated_str = key[1] or get("created_at")
+    sla_breached = False
+    if updated_str:
+        try:
+            upd = _parse_iso(updated_str)
+            if now - upd > timedelta(days=5):
+                sla_breached = True
+        except Exception:
+            pass
+    out["sla_breached"] = sla_breached
+
+    return out
+
+
+def _enrich_dem_static(dem):
+    """Campos de enrich_dem que no dependen de la hora actual."""
+    dem = dem.copy()
+    get = dem.get
 
     # Normalizar notas (sin modificar el JSON en disco)
-    raw_notes = dem.get("notes") or []
+    raw_notes = get("notes") or []
     cleaned_notes = []
     for n in raw_notes:
         if isinstance(n, dict):
@@ -241,44 +676,31 @@ def enrich_dem(dem):
     dem["notes"] = cleaned_notes
     notes = cleaned_notes
 
-    # Duración en días
-    start_date = dem.get("start_date")
-    dem["duration_days"] = None
-    if start_date:
-        try:
-            dt = datetime.strptime(start_date, "%Y-%m-%d")
-            dem["duration_days"] = (datetime.utcnow().date() - dt.date()).days
-        except Exception:
-            pass
-
-    # Última nota formateada
+    # Última nota: formateada + texto/fecha sueltos (los leen los reportes)
     if notes:
-        dem["last_note"] = _format_note(notes[-1])
+        last = notes[-1]
+        dem["last_note"] = _format_note(last)
+        if isinstance(last, dict):
+            dem["last_note_text"] = last.get("text", "")
+            dem["last_note_date"] = last.get("date", "N/A")
+        else:
+            dem["last_note_text"] = last
+            dem["last_note_date"] = "N/A"
     else:
         dem["last_note"] = ""
-
-    # SLA (5 días sin actualización)
-    updated_str = dem.get("updated_at") or dem.get("created_at")
-    sla_breached = False
-    if updated_str:
-        try:
-            upd = datetime.fromisoformat(updated_str)
-            if datetime.utcnow() - upd > timedelta(days=5):
-                sla_breached = True
-        except Exception:
-            pass
-    dem["sla_breached"] = sla_breached
+        dem["last_note_text"] = ""
+        dem["last_note_date"] = ""
 
     # Archivado
     if "archived" not in dem:
         dem["archived"] = False
 
     # Prioridad por defecto
-    if not dem.get("priority"):
+    if not get("priority"):
         dem["priority"] = "2"
 
     # Lista de documentos
-    docs = dem.get("documents")
+    docs = get("documents")
     if docs is None or not isinstance(docs, list):
         dem["documents"] = []
 
@@ -311,7 +733,7 @@ def generate_ai_comment(dem):
         return "No AI comment available."
 
 
-def build_portfolio_text(dems):
+def build_portfolio_text(dems, stats=None):
     """
     Construye el texto corporativo del portafolio para TXT/DOCX/PDF y el panel de UI.
 
@@ -320,67 +742,65 @@ def build_portfolio_text(dems):
 
     IMPORTANTE:
       - Solo se deben pasar DEMs activos (no archivados).
+      - `stats` (de active_dem_stats) solo si `dems` es el portafolio activo completo.
     """
-    if not dems:
-        return "There are currently no DEM projects registered."
+    return "\n".join(line for _, line in portfolio_lines(dems, stats))
 
-    enriched = [enrich_dem(d) for d in dems]
 
-    run_date_human = datetime.utcnow().strftime("%B %d, %Y")
-    header = f"{run_date_human} — Andres Villanueva DEMS Report"
+def portfolio_lines(dems, stats=None):
+    """
+    Líneas del reporte de portafolio como (tipo, texto), en el mismo orden
+    que build_portfolio_text. DOCX/PDF usan el tipo en vez de re-parsear
+    el texto con startswith().
 
-    lines = []
-    lines.append(header)
-    lines.append("")
-    lines.append("1. Projects Resume — Executive Overview")
-    lines.append("")
+    Tipos: title, resume, details, text, blank, sep, project, notes_head, note.
+    """
+    if not dems:
+        yield "title", "There are currently no DEM projects registered."
+        return
 
-    total = len(enriched)
+    now = datetime.utcnow()
+    enriched = [enrich_dem(d, now) for d in dems]
 
-    # Distribución de prioridades
-    p1 = p2 = p3 = p4 = 0
-    sla_ok = sla_breached = 0
-    status_counts = {}
+    run_date_human = now.strftime("%B %d, %Y")
+    sep = "-" * 78
 
-    for e in enriched:
-        pr = str(e.get("priority") or "2")
-        if pr == "1":
-            p1 += 1
-        elif pr == "2":
-            p2 += 1
-        elif pr == "3":
-            p3 += 1
-        elif pr == "4":
-            p4 += 1
-
-        if e.get("sla_breached"):
-            sla_breached += 1
-        else:
-            sla_ok += 1
+    yield "title", f"{run_date_human} — Andres Villanueva DEMS Report"
+    yield "blank", ""
+    yield "resume", "1. Projects Resume — Executive Overview"
+    yield "blank", ""
+
+    total = len(enriched)
 
-        st = e.get("status") or "N/A"
-        status_counts[st] = status_counts.get(st, 0) + 1
+    # Distribución de prioridades / SLA / estados (conteo en C con Counter)
+    if stats is not None:
+        prio_counts = stats["priority"]
+        status_counts = stats["status"]
+    else:
+        prio_counts = Counter(str(e.get("priority") or "2") for e in enriched)
+        status_counts = Counter(e.get("status") or "N/A" for e in enriched)
+    p1, p2, p3, p4 = (prio_counts[k] for k in ("1", "2", "3", "4"))
+    sla_breached = sum(1 for e in enriched if e.get("sla_breached"))
+    sla_ok = total - sla_breached
 
     # Métricas clave
-    lines.append("Key portfolio metrics for active DEM projects:")
-    lines.append(f"• Total active DEMs: {total}")
-    lines.append("• Priority distribution:")
-    lines.append(f"   – P1 (Critical): {p1}")
-    lines.append(f"   – P2 (High): {p2}")
-    lines.append(f"   – P3 (Medium): {p3}")
-    lines.append(f"   – P4 (Low): {p4}")
-    lines.append(f"• SLA window (last 5 days): OK={sla_ok} | Breached={sla_breached}")
+    yield "text", "Key portfolio metrics for active DEM projects:"
+    yield "text", f"• Total active DEMs: {total}"
+    yield "text", "• Priority distribution:"
+    yield "text", f"   – P1 (Critical): {p1}"
+    yield "text", f"   – P2 (High): {p2}"
+    yield "text", f"   – P3 (Medium): {p3}"
+    yield "text", f"   – P4 (Low): {p4}"
+    yield "text", f"• SLA window (last 5 days): OK={sla_ok} | Breached={sla_breached}"
 
     if status_counts:
-        top_status = sorted(status_counts.items(), key=lambda kv: kv[1], reverse=True)[
-            :3
-        ]
+        top_status = status_counts.most_common(3)
         status_str = ", ".join(f"{name}: {cnt}" for name, cnt in top_status)
-        lines.append(f"• Most common DEM Status: {status_str}")
+        yield "text", f"• Most common DEM Status: {status_str}"
 
-    lines.append("")
-    lines.append("Active DEM overview (project name + latest comment):")
-    lines.append("")
+    yield "blank", ""
+    yield "text", "Active DEM overview (project name + latest comment):"
+    yield "blank", ""
 
     for e in enriched:
         name = e.get("name", "(no name)")
@@ -388,76 +808,64 @@ def build_portfolio_text(dems):
         workflow = e.get("workflow_status", "-")
         pr = e.get("priority", "2")
 
-        raw_notes = e.get("notes") or []
-        if raw_notes:
-            latest = _format_note(raw_notes[-1])
+        if e.get("notes"):
+            latest = e["last_note"]
         else:
             latest = "No recent notes registered."
 
-        lines.append(
-            f"• {name} — Status: {status} | Workflow: {workflow} | Priority: P{pr}"
-        )
-        lines.append(f"  Last update: {latest}")
-        lines.append("")
+        yield "text", f"• {name} — Status: {status} | Workflow: {workflow} | Priority: P{pr}"
+        yield "text", f"  Last update: {latest}"
+        yield "blank", ""
 
     # Línea de separación donde marcaste en rojo
-    lines.append("-" * 78)
-    lines.append("")
-    lines.append(
+    yield "sep", sep
+    yield "blank", ""
+    yield "text", (
         "The following pages contain a detailed section per DEM, including "
         "Project Title, Sponsor, BA Owner, Workflow Status, SLA condition and "
         "the most recent notes captured during project follow-up."
     )
-    lines.append("")
-    lines.append("-" * 78)
-    lines.append("")
-    lines.append("2. Projects Details")
-    lines.append("")
+    yield "blank", ""
+    yield "sep", sep
+    yield "blank", ""
+    yield "details", "2. Projects Details"
+    yield "blank", ""
 
     # Detalle por DEM
     for e in enriched:
-        lines.append(f"Project: {e.get('name', '(no name)')}")
-        lines.append(f"Project Title: {e.get('title', '')}")
-        lines.append(
-            f"Sponsor: {e.get('sponsor', '-')}"
-            f" | Requester: {e.get('requester', '-')}"
+        sla_text = (
+            "SLA Breached — project requires immediate follow-up with Sponsor and IT lead."
+            if e.get("sla_breached")
+            else "SLA OK — project updated within acceptable window."
         )
-        lines.append(
+        yield "project", f"Project: {e.get('name', '(no name)')}"
+        yield "text", f"Project Title: {e.get('title', '')}"
+        yield "text", f"Sponsor: {e.get('sponsor', '-')} | Requester: {e.get('requester', '-')}"
+        yield "text", (
             f"BA Owner: {e.get('ba_owner', '-')}"
             f" | Current Task Owner: {e.get('current_owner', '-')}"
         )
-        lines.append(f"Cost Center: {e.get('cost_center', '-')}")
-        lines.append(
+        yield "text", f"Cost Center: {e.get('cost_center', '-')}"
+        yield "text", (
             f"Start Date: {e.get('start_date', '-')}"
             f" | Duration (days): {e.get('duration_days')}"
         )
-        lines.append(f"DEM Status: {e.get('status', '-')}")
-        lines.append(f"Workflow Status: {e.get('workflow_status', '-')}")
-        lines.append(f"Priority (1–4): {e.get('priority', '2')}")
-        lines.append(
-            "SLA Status: "
-            + (
-                "SLA Breached — project requires immediate follow-up with Sponsor and IT lead."
-                if e.get("sla_breached")
-                else "SLA OK — project updated within acceptable window."
-            )
-        )
+        yield "text", f"DEM Status: {e.get('status', '-')}"
+        yield "text", f"Workflow Status: {e.get('workflow_status', '-')}"
+        yield "text", f"Priority (1–4): {e.get('priority', '2')}"
+        yield "text", f"SLA Status: {sla_text}"
 
         raw_notes = e.get("notes") or []
         if raw_notes:
-            formatted_notes = [_format_note(n) for n in raw_notes]
-            last_two = formatted_notes[-2:]
-            lines.append("Last Notes (most recent entries):")
-            for n in last_two:
-                lines.append(f"- {n}")
+            yield "notes_head", "Last Notes (most recent entries):"
+            for n in raw_notes[-2:]:
+                yield "note", f"- {_format_note(n)}"
         else:
-            lines.append("Last Notes: (no notes registered)")
+            yield "notes_head", "Last Notes: (no notes registered)"
 
-        lines.append("")
-        lines.append("-" * 78)
-        lines.append("")
-
-    return "\n".join(lines)
+        yield "blank", ""
+        yield "sep", sep
+        yield "blank", ""
 
 
 # ---------------- Auth & Views ----------------
@@ -491,6 +899,17 @@ def require_auth():
     return None
 
 
+@app.before_request
+def _api_auth():
+    """
+    Sesión obligatoria para toda la API (/api/...): un solo chequeo aquí en
+    lugar del prólogo repetido en cada endpoint. Las páginas HTML siguen
+    usando require_auth() para redirigir al login.
+    """
+    if request.path.startswith("/api/") and not session.get("auth"):
+        return jsonify({"error": "No autorizado"}), 401
+
+
 @app.route("/")
 def home():
     maybe = require_auth()
@@ -510,6 +929,11 @@ def dems_page():
 # ---------------- Chat & Files (main chat page) ----------------
 
 
+def _sse_event(payload):
+    """Serializa un evento Server-Sent Events (una línea data: JSON)."""
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
 @app.route("/chat", methods=["POST"])
 def chat():
     maybe = require_auth()
@@ -554,15 +978,68 @@ def chat():
                 stream=True,
                 timeout=60,
                 max_tokens=1000,
+                stream_options={"include_usage": False},
             )
             for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
+                if not chunk.choices:
+                    continue
+                content = chunk.choices[0].delta.content
+                if content is not None:
+                    yield _sse_event({"delta": content})
         except Exception as e:
             _log(f"Error in OpenAI chat: {e}")
-            yield f"Error: {str(e)}"
+            yield _sse_event({"delta": f"Error: {str(e)}"})
+        yield "event: done\ndata: {}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"},
+    )
+
+
+def _save_upload(storage, path):
+    """Copia el stream subido a disco en bloques de 1 MiB."""
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=UPLOAD_TMP_DIR, suffix=".part")
+    try:
+        with open(fd, "wb", buffering=0) as dst:
+            shutil.copyfileobj(storage.stream, dst, length=UPLOAD_CHUNK_SIZE)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
 
-    return Response(stream_with_context(generate()), mimetype="text/plain")
+def _summarize_upload(text):
+    """Resumen corto de un archivo subido desde el chat principal."""
+    if not text:
+        return "I could not read this file (unsupported or empty)."
+    try:
+        completion = client.with_options(timeout=30).chat.completions.create(
+            model=DEFAULT_MODEL,
+            messages=[
+                {
+                    "role": "user",
+                    "content": (
+                        "Summarize the following document in a few bullet points, "
+                        "highlighting key information useful for IT, business analysis "
+                        "and project follow-up:\n\n"
+                        f"{text[:8000]}"
+                    ),
+                }
+            ],
+        )
+        return completion.choices[0].message.content
+    except Exception as e:
+        _log(f"Error summarizing file: {e}")
+        return (
+            "An automatic summary could not be generated, "
+            "but the file was uploaded correctly."
+        )
 
 
 @app.route("/upload", methods=["POST"])
@@ -579,50 +1056,29 @@ def upload():
     if not files:
         return jsonify({"error": "No files were sent."}), 400
 
-    results = []
+    # 1) Guardar (secuencial: las partes llegan en orden en el mismo stream)
+    batch = []
     for f in files:
         filename = secure_filename(f.filename or "file")
         save_name = f"{int(time.time())}_{filename}"
         path = os.path.join(app.config["UPLOAD_FOLDER"], save_name)
         _log(f"Saving uploaded file at {path}")
 
-        f.save(path)
-
-        text = extract_text(path)
-        if not text:
-            results.append(
-                {
-                    "filename": filename,
-                    "summary": "I could not read this file (unsupported or empty).",
-                }
-            )
-            continue
-
-        try:
-            completion = client.chat.completions.create(
-                model=DEFAULT_MODEL,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": (
-                            "Summarize the following document in a few bullet points, "
-                            "highlighting key information useful for IT, business analysis "
-                            "and project follow-up:\n\n"
-                            f"{text[:8000]}"
-                        ),
-                    }
-                ],
-            )
-            summary = completion.choices[0].message.content
-        except Exception as e:
-            _log(f"Error summarizing file: {e}")
-            summary = (
-                "An automatic summary could not be generated, "
-                "but the file was uploaded correctly."
-            )
+        _save_upload(f, path)
+        batch.append((filename, path))
 
-        results.append({"filename": filename, "summary": summary})
+    # 2) Extraer + resumir por archivo en paralelo: la extracción de uno se
+    #    solapa con la espera de OpenAI de los demás
+    with ThreadPoolExecutor(max_workers=min(8, len(batch))) as pool:
+        summaries = list(pool.map(
+            lambda item: _summarize_upload(extract_text(item[1], max_chars=8000)),
+            batch,
+        ))
 
+    results = [
+        {"filename": filename, "summary": summary}
+        for (filename, _), summary in zip(batch, summaries)
+    ]
     return jsonify({"files": results})
 
 
@@ -630,16 +1086,20 @@ def upload():
 
 
 def get_dems_filtered(archived: bool):
+    return list(iter_dems_filtered(archived))
+
+
+def iter_dems_filtered(archived: bool):
+    """Como get_dems_filtered, pero enriquece de a un DEM (para exports en streaming)."""
     dems = load_dems()
-    return [enrich_dem(d) for d in dems if bool(d.get("archived", False)) == archived]
+    now = datetime.utcnow()
+    for d in dems:
+        if bool(d.get("archived", False)) == archived:
+            yield enrich_dem(d, now)
 
 
 @app.route("/api/dems/projects", methods=["GET"])
 def list_dems():
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     archived_str = request.args.get("archived", "false").lower()
     archived = archived_str in ("1", "true", "yes")
     projects = get_dems_filtered(archived)
@@ -648,10 +1108,6 @@ def list_dems():
 
 @app.route("/api/dems/projects", methods=["POST"])
 def create_dem():
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     data = request.get_json() or {}
     now_iso = datetime.utcnow().isoformat()
 
@@ -686,31 +1142,27 @@ def create_dem():
             }
         )
 
-    dems = load_dems()
-    dems.append(dem)
-    save_dems(dems)
+    _append_dem_event({"op": "put", "id": dem["id"], "dem": dem})
 
     return jsonify({"project": enrich_dem(dem)})
 
 
 def _update_dem(id, updater):
-    dems = load_dems()
-    for i, d in enumerate(dems):
-        if d.get("id") == id:
+    # Bajo lock: otro worker no puede escribir entre la lectura y el append
+    with dems_write_lock():
+        d = get_dem(id)
+        if d is not None:
+            # Copia profunda: el dict cacheado no se toca si el updater falla
+            d = copy.deepcopy(d)
             updater(d)
             d["updated_at"] = datetime.utcnow().isoformat()
-            dems[i] = d
-            save_dems(dems)
+            _append_dem_event({"op": "put", "id": id, "dem": d})
             return enrich_dem(d)
     return None
 
 
 @app.route("/api/dems/projects/<id>/note", methods=["POST"])
 def add_dem_note(id):
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     data = request.get_json() or {}
     text = (data.get("text") or "").strip()
     if not text:
@@ -739,10 +1191,6 @@ def add_dem_note(id):
 # ---- EDIT NOTE ---------------------------------------------------------
 @app.route("/api/dems/projects/<id>/note/edit", methods=["POST"])
 def edit_dem_note(id):
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "Unauthorized"}), 401
-
     data = request.get_json() or {}
     index = data.get("index")
     new_text = (data.get("text") or "").strip()
@@ -778,10 +1226,6 @@ def edit_dem_note(id):
 # ---- DELETE NOTE ---------------------------------------------------------
 @app.route("/api/dems/projects/<id>/note/delete", methods=["POST"])
 def delete_dem_note(id):
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "Unauthorized"}), 401
-
     data = request.get_json() or {}
     index = data.get("index")
 
@@ -812,10 +1256,6 @@ def delete_dem_note(id):
 
 @app.route("/api/dems/projects/<id>/summary/delete", methods=["POST"])
 def delete_dem_summary(id):
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "Unauthorized"}), 401
-
     def updater(d):
         d["doc_summary"] = ""
 
@@ -832,10 +1272,6 @@ def delete_dem_summary(id):
 
 @app.route("/api/dems/projects/<id>/update", methods=["POST"])
 def update_dem(id):
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     data = request.get_json() or {}
 
     def updater(d):
@@ -864,10 +1300,6 @@ def update_dem(id):
 
 @app.route("/api/dems/projects/<id>/archive", methods=["POST"])
 def archive_dem(id):
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     def updater(d):
         d["archived"] = True
 
@@ -879,10 +1311,6 @@ def archive_dem(id):
 
 @app.route("/api/dems/projects/<id>/restore", methods=["POST"])
 def restore_dem(id):
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     def updater(d):
         d["archived"] = False
 
@@ -894,25 +1322,16 @@ def restore_dem(id):
 
 @app.route("/api/dems/projects/<id>/delete", methods=["POST"])
 def delete_dem(id):
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
-    dems = load_dems()
-    new_dems = [d for d in dems if d.get("id") != id]
-    if len(new_dems) == len(dems):
-        return jsonify({"error": "DEM no encontrado."}), 404
-    save_dems(new_dems)
+    with dems_write_lock():
+        if get_dem(id) is None:
+            return jsonify({"error": "DEM no encontrado."}), 404
+        _append_dem_event({"op": "delete", "id": id})
     return jsonify({"success": True})
 
 
 @app.route("/api/dems/projects/<id>/attach", methods=["POST"])
 def attach_doc(id):
     """Attach a document to a DEM, analyze it and store the summary."""
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     if "file" not in request.files:
         return jsonify({"error": "No se recibió archivo."}), 400
 
@@ -920,9 +1339,9 @@ def attach_doc(id):
     filename = secure_filename(file.filename or "document")
     save_name = f"{int(time.time())}_{filename}"
     path = os.path.join(app.config["UPLOAD_FOLDER"], save_name)
-    file.save(path)
+    _save_upload(file, path)
 
-    text = extract_text(path)
+    text = extract_text(path, max_chars=8000)
     if not text:
         return jsonify(
             {
@@ -986,130 +1405,121 @@ def attach_doc(id):
 
 
 
-@app.route("/api/dems/export", methods=["GET"])
-def export_active_excel():
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
-    if Workbook is None:
-        return jsonify({"error": "openpyxl no está disponible en el servidor."}), 500
+_EXCEL_HEADERS = (
+    "ID",
+    "Name",
+    "Title",
+    "Sponsor",
+    "Requester",
+    "BA Owner",
+    "Cost Center",
+    "Status",
+    "Workflow Status",
+    "Current Task Owner",
+    "Start Date",
+    "Duration Days",
+    "SLA",
+    "Last Note",
+)
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Active DEMs"
-
-    headers = [
-        "ID",
-        "Name",
-        "Title",
-        "Sponsor",
-        "Requester",
-        "BA Owner",
-        "Cost Center",
-        "Status",
-        "Workflow Status",
-        "Current Task Owner",
-        "Start Date",
-        "Duration Days",
-        "SLA",
-        "Last Note",
-    ]
-    ws.append(headers)
-
-    for dem in get_dems_filtered(False):
-        ws.append(
-            [
-                dem.get("id"),
-                dem.get("name"),
-                dem.get("title"),
-                dem.get("sponsor"),
-                dem.get("requester"),
-                dem.get("ba_owner"),
-                dem.get("cost_center"),
-                dem.get("status"),
-                dem.get("workflow_status"),
-                dem.get("current_owner"),
-                dem.get("start_date"),
-                dem.get("duration_days"),
-                "Breached" if dem.get("sla_breached") else "OK",
-                dem.get("last_note"),
-            ]
+_XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _excel_rows(archived):
+    """Filas del export Excel (una tupla por DEM, mismo orden que _EXCEL_HEADERS)."""
+    for dem in iter_dems_filtered(archived):
+        get = dem.get
+        yield (
+            get("id"),
+            get("name"),
+            get("title"),
+            get("sponsor"),
+            get("requester"),
+            get("ba_owner"),
+            get("cost_center"),
+            get("status"),
+            get("workflow_status"),
+            get("current_owner"),
+            get("start_date"),
+            get("duration_days"),
+            "Breached" if get("sla_breached") else "OK",
+            get("last_note"),
         )
 
-    bio = io.BytesIO()
-    wb.save(bio)
-    bio.seek(0)
-    return send_file(
-        bio,
-        as_attachment=True,
-        download_name="dems_active.xlsx",
-        mimetype="application/"
-        "vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
 
+# Último XLSX generado por vista (activos/archivados): (etag, bytes)
+_EXCEL_EXPORT_CACHE = {}
+_EXCEL_EXPORT_CACHE_MAX_BYTES = 10 * 1024 * 1024
 
-@app.route("/api/dems/export_archived", methods=["GET"])
-def export_archived_excel():
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
 
-    if Workbook is None:
-        return jsonify({"error": "openpyxl no está disponible en el servidor."}), 500
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Archived DEMs"
-
-    headers = [
-        "ID",
-        "Name",
-        "Title",
-        "Sponsor",
-        "Requester",
-        "BA Owner",
-        "Cost Center",
-        "Status",
-        "Workflow Status",
-        "Current Task Owner",
-        "Start Date",
-        "Duration Days",
-        "SLA",
-        "Last Note",
-    ]
-    ws.append(headers)
-
-    for dem in get_dems_filtered(True):
-        ws.append(
-            [
-                dem.get("id"),
-                dem.get("name"),
-                dem.get("title"),
-                dem.get("sponsor"),
-                dem.get("requester"),
-                dem.get("ba_owner"),
-                dem.get("cost_center"),
-                dem.get("status"),
-                dem.get("workflow_status"),
-                dem.get("current_owner"),
-                dem.get("start_date"),
-                dem.get("duration_days"),
-                "Breached" if dem.get("sla_breached") else "OK",
-                dem.get("last_note"),
-            ]
-        )
+def _dems_excel_response(archived, sheet_title, download_name):
+    """
+    XLSX de DEMs en streaming: xlsxwriter (constant_memory) si está instalado,
+    si no openpyxl en modo write_only.
 
-    bio = io.BytesIO()
-    wb.save(bio)
-    bio.seek(0)
-    return send_file(
-        bio,
+    El ETag sale de las filas (incluyen duración/SLA, que cambian con la hora):
+    si coincide se responde 304 o se reutiliza el último libro sin regenerarlo.
+    """
+    rows = list(_excel_rows(archived))
+    etag = hashlib.sha1(_json_dumps([sheet_title, rows])).hexdigest()
+    # Comparación débil (RFC 9110 para GET): acepta W/"..." y "*"
+    if request.if_none_match.contains_weak(etag):
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        return resp
+
+    cached = _EXCEL_EXPORT_CACHE.get(archived)
+    if cached is not None and cached[0] == etag:
+        tmp = io.BytesIO(cached[1])
+    else:
+        # En memoria: send_file sobre un SpooledTemporaryFile lo forzaría a
+        # disco (fileno() para sendfile) sin ganar nada
+        tmp = io.BytesIO()
+
+        if xlsxwriter is not None:
+            wb = xlsxwriter.Workbook(tmp, {"constant_memory": True})
+            ws = wb.add_worksheet(sheet_title)
+            ws.write_row(0, 0, _EXCEL_HEADERS)
+            for r, row in enumerate(rows, start=1):
+                ws.write_row(r, 0, row)
+            wb.close()
+        else:
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet(sheet_title)
+            ws.append(_EXCEL_HEADERS)
+            for row in rows:
+                ws.append(row)
+            wb.save(tmp)
+
+        if tmp.tell() <= _EXCEL_EXPORT_CACHE_MAX_BYTES:
+            _EXCEL_EXPORT_CACHE[archived] = (etag, tmp.getvalue())
+        tmp.seek(0)
+
+    resp = send_file(
+        tmp,
         as_attachment=True,
-        download_name="dems_archived.xlsx",
-        mimetype="application/"
-        "vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        download_name=download_name,
+        mimetype=_XLSX_MIME,
     )
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+@app.route("/api/dems/export", methods=["GET"])
+def export_active_excel():
+    if Workbook is None and xlsxwriter is None:
+        return jsonify({"error": "openpyxl no está disponible en el servidor."}), 500
+
+    return _dems_excel_response(False, "Active DEMs", "dems_active.xlsx")
+
+
+@app.route("/api/dems/export_archived", methods=["GET"])
+def export_archived_excel():
+    if Workbook is None and xlsxwriter is None:
+        return jsonify({"error": "openpyxl no está disponible en el servidor."}), 500
+
+    return _dems_excel_response(True, "Archived DEMs", "dems_archived.xlsx")
 
 
 # -------- Export / Import JSON (backup) ----------------------
@@ -1121,22 +1531,32 @@ def export_dems_json():
     Exporta TODOS los DEMs (activos + archivados) como backup JSON.
     El botón “Export JSON” del frontend debe llamar a este endpoint.
     """
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     dems = load_dems() or []
-    payload = json.dumps(dems, ensure_ascii=False, indent=2)
-    bio = io.BytesIO(payload.encode("utf-8"))
-    bio.seek(0)
-    return send_file(
-        bio,
-        as_attachment=True,
-        download_name="dems_backup.json",
+    return Response(
+        _iter_dems_json(dems),
         mimetype="application/json; charset=utf-8",
+        headers={"Content-Disposition": "attachment; filename=dems_backup.json"},
     )
 
 
+def _iter_dems_json(dems):
+    """
+    Genera el mismo texto que json.dumps(dems, indent=2), un DEM por chunk,
+    para no materializar el backup completo en memoria.
+    """
+    if not dems:
+        yield b"[]"
+        return
+    yield b"["
+    for i, dem in enumerate(dems):
+        if orjson is not None:
+            item = orjson.dumps(dem, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        else:
+            item = json.dumps(dem, ensure_ascii=False, indent=2).encode("utf-8")
+        yield (b"\n  " if i == 0 else b",\n  ") + item.replace(b"\n", b"\n  ")
+    yield b"\n]"
+
+
 @app.route("/api/dems/import", methods=["POST"])
 def import_dems_json():
     """
@@ -1146,35 +1566,104 @@ def import_dems_json():
         POST /api/dems/import
         { "projects": [ {..dem1..}, {..dem2..}, ... ] }
     """
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
+    # Parseo y deduplicación fuera del lock (pueden ser largos)
+    incoming_by_id, error = _read_import_projects()
+    if error is not None:
+        return jsonify({"error": error}), 400
 
-    data = request.get_json(silent=True) or {}
-    projects = data.get("projects")
+    with dems_write_lock():
+        current = load_dems() or []
+        by_id = {str(d.get("id")): d for d in current if d.get("id")}
+        by_id.update(incoming_by_id)
+
+        merged_list = list(by_id.values())
+        save_dems(merged_list)
+
+    now = datetime.utcnow()
+    enriched = [enrich_dem(d, now) for d in merged_list]
+    return jsonify({"projects": enriched})
 
-    if not isinstance(projects, list):
-        return jsonify(
-            {"error": "Invalid JSON structure: 'projects' must be a list."}
-        ), 400
 
-    current = load_dems() or []
-    by_id = {str(d.get("id")): d for d in current if d.get("id")}
+def _merge_import_projects(projects, incoming_by_id):
+    """
+    Agrega los DEMs a incoming_by_id (el último con cada id gana).
 
+    Ids nuevos consecutivos desde un solo timestamp: varios DEMs sin id en
+    el mismo milisegundo no se pisan entre sí.
+    """
+    next_ms = int(time.time() * 1000)
     for incoming in projects:
         if not isinstance(incoming, dict):
             continue
         pid = str(incoming.get("id") or "").strip()
         if not pid:
-            pid = f"dem_{int(time.time() * 1000)}"
+            pid = f"dem_{next_ms}"
+            next_ms += 1
             incoming["id"] = pid
-        by_id[pid] = incoming
+        incoming_by_id[pid] = incoming
 
-    merged_list = list(by_id.values())
-    save_dems(merged_list)
 
-    enriched = [enrich_dem(d) for d in merged_list]
-    return jsonify({"projects": enriched})
+class _ImportStream:
+    """
+    request.stream para ijson. ijson sondea el tipo con read(0), y el
+    LimitedStream de Werkzeug (servidor de desarrollo, test client) toma una
+    lectura vacía como desconexión del cliente: aquí read(0) no llega al stream.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def read(self, size=-1):
+        if size == 0:
+            return b""
+        return self._stream.read(size)
+
+
+_IMPORT_NOT_LIST = "Invalid JSON structure: 'projects' must be a list."
+_IMPORT_BAD_JSON = "Invalid JSON payload."
+
+
+def _read_import_projects():
+    """
+    (DEMs de "projects" como {id: dem}, None) o (None, mensaje de error) si el
+    JSON no es válido o "projects" falta o no es una lista ({"projects": []}
+    es válido).
+
+    Con ijson se recorre request.stream DEM por DEM y cada uno va directo al
+    dict (no hay lista intermedia); el dict sí contiene todo el import, ya que
+    se fusiona y guarda de una vez. Sin ijson: cuerpo crudo + _json_loads.
+    """
+    incoming_by_id = {}
+    if ijson is not None:
+        seen = {"list": False}
+
+        def events():
+            stream = _ImportStream(request.stream)
+            for prefix, event, value in ijson.parse(stream, use_float=True):
+                if prefix == "projects" and event == "start_array":
+                    seen["list"] = True
+                yield prefix, event, value
+
+        try:
+            _merge_import_projects(ijson.items(events(), "projects.item"), incoming_by_id)
+        except ijson.JSONError as e:
+            _log(f"Invalid DEM import JSON: {e}")
+            return None, _IMPORT_BAD_JSON
+        if not seen["list"]:
+            return None, _IMPORT_NOT_LIST
+        return incoming_by_id, None
+
+    # Cuerpo crudo + orjson (si está): evita el parseo de request.get_json
+    try:
+        data = _json_loads(request.get_data(cache=False))
+    except ValueError as e:
+        _log(f"Invalid DEM import JSON: {e}")
+        return None, _IMPORT_BAD_JSON
+    projects = data.get("projects") if isinstance(data, dict) else None
+    if not isinstance(projects, list):
+        return None, _IMPORT_NOT_LIST
+    _merge_import_projects(projects, incoming_by_id)
+    return incoming_by_id, None
 
 
 # -------- Reporte resumen para panel y descargas -------------
@@ -1228,10 +1717,6 @@ def generate_portfolio_analysis(projects):
 @app.route("/api/dems/report", methods=["POST"])
 def dem_report():
     """Texto del reporte para el panel (solo DEMs activos)."""
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     dems = load_dems()
     active_dems = [d for d in dems if not d.get("archived", False)]
     
@@ -1244,119 +1729,76 @@ def dem_report():
 
 
 def build_portfolio_html(projects, ai_summary=None):
-    """Generates a Minimalist Cyberpunk Terminal-style HTML report."""
+    """
+    Generates a Minimalist Cyberpunk Terminal-style HTML report.
+
+    La plantilla (templates/portfolio_report.html) la compila Jinja una vez
+    y se cachea; los valores se escapan automáticamente.
+    """
     now_str = datetime.utcnow().strftime("%B %d, %Y")
     
-    # Metrics calculations
+    # Metrics calculations (una sola pasada sobre los proyectos)
     total = len(projects)
-    p1 = len([p for p in projects if str(p.get('priority')) == '1'])
-    p2 = len([p for p in projects if str(p.get('priority')) == '2'])
-    p3 = len([p for p in projects if str(p.get('priority')) == '3'])
-    p4 = len([p for p in projects if str(p.get('priority')) == '4'])
-    
-    sla_breached = len([p for p in projects if p.get('sla_breached')])
-    sla_ok = total - sla_breached
+    prio_counts = Counter()
+    status_counts = Counter()
+    sla_breached = 0
+    for p in projects:
+        prio_counts[str(p.get('priority'))] += 1
+        status_counts[p.get("status", "Unknown")] += 1
+        if p.get('sla_breached'):
+            sla_breached += 1
 
     # Most common status
-    statuses = [p.get("status", "Unknown") for p in projects]
-    if statuses:
-        common_status = max(set(statuses), key=statuses.count)
-        common_status_count = statuses.count(common_status)
+    if status_counts:
+        common_status, common_status_count = status_counts.most_common(1)[0]
         status_summary = f"{common_status}: {common_status_count}"
     else:
         status_summary = "N/A"
 
     # If AI summary is provided, format it for HTML
     if ai_summary:
-        # Convert newlines to <br> for HTML display
-        formatted_summary = ai_summary.replace("\n", "<br>")
+        # Convert newlines to <br> for HTML display (el texto de la IA se escapa)
+        formatted_summary = escape(ai_summary).replace("\n", Markup("<br>"))
     else:
         formatted_summary = "Analyzing portfolio data... No summary available."
 
-    html = f"""
-    <div style="font-family: 'Roboto Mono', monospace; color: #e0e0e0; background-color: #0d0d0d; padding: 20px; border: 1px solid #333; border-radius: 5px; max-width: 1000px; margin: 0 auto;">
-        <!-- Header -->
-        <div style="margin-bottom: 25px; border-bottom: 1px dashed #444; padding-bottom: 15px;">
-            <div style="display: inline-block; border: 1px solid #fcee0a; color: #fcee0a; padding: 2px 8px; font-weight: bold; margin-bottom: 10px; box-shadow: 2px 2px 0px #fcee0a;">
-                📄 PORTFOLIO REPORT
-            </div>
-            <div style="color: #888; font-size: 12px; margin-top: 5px;">
-                {now_str} — Andres Villanueva DEMS Report
-            </div>
-        </div>
-
-        <!-- AI Executive Summary -->
-        <div style="margin-bottom: 30px; background: rgba(20, 20, 20, 0.5); border-left: 3px solid #00f3ff; padding: 15px;">
-            <div style="color: #00f3ff; margin-bottom: 10px; font-weight: bold; text-transform: uppercase; letter-spacing: 1px;">
-                // AI EXECUTIVE OVERVIEW
-            </div>
-            <div style="font-size: 13px; color: #ccc; line-height: 1.6;">
-                {formatted_summary}
-            </div>
-        </div>
-        
-        <!-- Key Metrics (Compact) -->
-        <div style="margin-bottom: 30px; display: flex; gap: 20px; font-size: 12px; color: #888; border-bottom: 1px dashed #333; padding-bottom: 15px;">
-             <div>TOTAL: <span style="color: #fff;">{total}</span></div>
-             <div>CRITICAL (P1): <span style="color: #ff2a2a;">{p1}</span></div>
-             <div>SLA BREACHED: <span style="color: #ff2a2a;">{sla_breached}</span></div>
-             <div>STATUS: <span style="color: #ccc;">{status_summary}</span></div>
-        </div>
-
-        <!-- Projects -->
-        <div>
-            <div style="color: #fff; margin-bottom: 15px; font-weight: bold;">Active DEM overview (project name + latest comment):</div>
-            <div style="font-size: 13px; line-height: 1.5;">
-    """
+    return render_template(
+        "portfolio_report.html",
+        now_str=now_str,
+        formatted_summary=formatted_summary,
+        total=total,
+        p1=prio_counts["1"],
+        sla_breached=sla_breached,
+        status_summary=status_summary,
+        projects=projects,
+    )
+
+
+# Paletas de los gráficos del reporte
+_COLORS_PRIO = ['#1e3a8a', '#2563eb', '#60a5fa', '#93c5fd']
+_COLORS_SLA = ['#2563eb', '#ef4444']  # Blue for OK, Red for Breached
+_COLORS_STATUS = ['#1e3a8a', '#1d4ed8', '#2563eb', '#3b82f6', '#60a5fa', '#93c5fd']
 
-    for p in projects:
-        p_id = p.get("id", "N/A")
-        name = p.get("name", "Untitled")
-        status = p.get("status", "Unknown")
-        workflow = p.get("workflow_status", "Unknown")
-        priority = p.get("priority", "4")
-        notes = p.get("notes", [])
-        
-        # Get last note info
-        last_note_text = "No updates available."
-        last_note_date = "N/A"
-        
-        if notes:
-            # Try to find last AI insight first? No, user asked for "last text note" generally.
-            # Let's just take the absolute last note for "latest comment".
-            last_n = notes[-1]
-            last_note_text = last_n.get("text", "")
-            last_note_date = last_n.get("date", "N/A")
-            
-            # If it's an object with date/text
-            if isinstance(last_n, dict):
-                 last_note_text = last_n.get("text", "")
-                 last_note_date = last_n.get("date", "N/A")
-
-        priority_color = "#888"
-        if str(priority) == "1": priority_color = "#ff2a2a"
-        elif str(priority) == "2": priority_color = "#ffaa00"
-        elif str(priority) == "3": priority_color = "#00f3ff"
-
-        html += f"""
-        </div>
-        """
-
-    html += """
-        <div style="margin-top: 30px; border-top: 1px solid #333; padding-top: 10px; text-align: center; color: #444; font-size: 9px; font-family: 'Roboto Mono', monospace;">
-            END OF LINE
-        </div>
-    </div>
-    """
-    return html
+
+def _chart_figure(figsize):
+    """Figure + ejes con la API OO (sin el estado global ni el lock de pyplot)."""
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot(111)
+
+
+def _chart_png(fig):
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', transparent=True, dpi=150, bbox_inches='tight')
+    return buf.getvalue()
 
 
 def generate_charts(dems):
-    """Generate pie and bar charts for the report."""
-    charts = {}
-    
-    # 1. Priority Distribution (Horizontal Bar)
+    """Generate pie and bar charts for the report (PNG cacheados por conteos)."""
+    # Prioridad / SLA / estado en una sola pasada
     priority_counts = {1: 0, 2: 0, 3: 0, 4: 0}
+    sla_counts = {"OK": 0, "Breached": 0}
+    status_counts = {}
     for d in dems:
         p = d.get("priority", "4")
         try:
@@ -1366,17 +1808,36 @@ def generate_charts(dems):
         if p_int not in priority_counts:
             priority_counts[p_int] = 0
         priority_counts[p_int] += 1
-        
-    fig1, ax1 = plt.subplots(figsize=(5, 2))
+
+        if d.get("sla_breached"):
+            sla_counts["Breached"] += 1
+        else:
+            sla_counts["OK"] += 1
+
+        s = d.get("status", "Unknown")
+        status_counts[s] = status_counts.get(s, 0) + 1
+    # Sort by count
+    sorted_status = sorted(status_counts.items(), key=lambda x: x[1], reverse=True)
+
+    # Los gráficos solo dependen de los conteos: misma firma -> mismos PNG
+    pngs = _render_charts(
+        tuple(priority_counts[k] for k in (1, 2, 3, 4)),
+        (sla_counts["OK"], sla_counts["Breached"]),
+        tuple(sorted_status),
+    )
+    return {name: io.BytesIO(png) for name, png in zip(("priority", "sla", "status"), pngs)}
+
+
+@functools.lru_cache(maxsize=32)
+def _render_charts(prio_vals, sla_vals, sorted_status):
+    """Dibuja los tres gráficos y devuelve sus PNG como bytes (priority, sla, status)."""
+    fig1, ax1 = _chart_figure((5, 2))
     keys = [1, 2, 3, 4]
-    vals = [priority_counts[k] for k in keys]
+    vals = list(prio_vals)
     labels = ["Critical", "High", "Medium", "Low"]
     
-    # Blue palette for priority
-    colors_prio = ['#1e3a8a', '#2563eb', '#60a5fa', '#93c5fd'] 
-    
     y_pos = range(len(keys))
-    ax1.barh(y_pos, vals, color=colors_prio, height=0.5)
+    ax1.barh(y_pos, vals, color=_COLORS_PRIO, height=0.5)
     ax1.set_yticks(y_pos)
     ax1.set_yticklabels(labels, color="#000000", fontweight='bold') # Black text
     ax1.invert_yaxis()  # P1 top
@@ -1403,27 +1864,15 @@ def generate_charts(dems):
     fig1.patch.set_alpha(0.0)
     ax1.patch.set_alpha(0.0)
 
-    buf1 = io.BytesIO()
-    plt.savefig(buf1, format='png', transparent=True, dpi=150, bbox_inches='tight')
-    buf1.seek(0)
-    charts['priority'] = buf1
-    plt.close(fig1)
+    png_priority = _chart_png(fig1)
 
     # 2. SLA Status (Horizontal Bar)
-    sla_counts = {"OK": 0, "Breached": 0}
-    for d in dems:
-        if d.get("sla_breached"):
-            sla_counts["Breached"] += 1
-        else:
-            sla_counts["OK"] += 1
-            
-    fig2, ax2 = plt.subplots(figsize=(5, 2))
+    fig2, ax2 = _chart_figure((5, 2))
     keys_sla = ["OK", "Breached"]
-    vals_sla = [sla_counts["OK"], sla_counts["Breached"]]
-    colors_sla = ['#2563eb', '#ef4444'] # Blue for OK, Red for Breached
-    
+    vals_sla = list(sla_vals)
+
     y_pos2 = range(len(keys_sla))
-    ax2.barh(y_pos2, vals_sla, color=colors_sla, height=0.5)
+    ax2.barh(y_pos2, vals_sla, color=_COLORS_SLA, height=0.5)
     ax2.set_yticks(y_pos2)
     ax2.set_yticklabels(keys_sla, color="#000000", fontweight='bold') # Black text
     ax2.invert_yaxis()
@@ -1446,25 +1895,14 @@ def generate_charts(dems):
     fig2.patch.set_alpha(0.0)
     ax2.patch.set_alpha(0.0)
     
-    buf2 = io.BytesIO()
-    plt.savefig(buf2, format='png', transparent=True, dpi=150, bbox_inches='tight')
-    buf2.seek(0)
-    charts['sla'] = buf2
-    plt.close(fig2)
+    png_sla = _chart_png(fig2)
 
     # 3. Project Status (Horizontal Bar)
-    status_counts = {}
-    for d in dems:
-        s = d.get("status", "Unknown")
-        status_counts[s] = status_counts.get(s, 0) + 1    # Sort by count
-    sorted_status = sorted(status_counts.items(), key=lambda x: x[1], reverse=True)
     keys_stat = [x[0] for x in sorted_status]
     vals_stat = [x[1] for x in sorted_status]
     
-    fig3, ax3 = plt.subplots(figsize=(6, len(keys_stat)*0.5 + 1))
-    # Blue palette for status
-    colors_status = ['#1e3a8a', '#1d4ed8', '#2563eb', '#3b82f6', '#60a5fa', '#93c5fd']
-    bar_colors = [colors_status[i % len(colors_status)] for i in range(len(keys_stat))]
+    fig3, ax3 = _chart_figure((6, len(keys_stat)*0.5 + 1))
+    bar_colors = [_COLORS_STATUS[i % len(_COLORS_STATUS)] for i in range(len(keys_stat))]
     
     y_pos3 = range(len(keys_stat))
     ax3.barh(y_pos3, vals_stat, color=bar_colors, height=0.6)
@@ -1493,31 +1931,113 @@ def generate_charts(dems):
     fig3.patch.set_alpha(0.0)
     ax3.patch.set_alpha(0.0)
 
-    buf3 = io.BytesIO()
-    plt.savefig(buf3, format='png', transparent=True, dpi=150, bbox_inches='tight')
-    buf3.seek(0)
-    charts['status'] = buf3
-    plt.close(fig3)
+    png_status = _chart_png(fig3)
+
+    return png_priority, png_sla, png_status
+
+@functools.lru_cache(maxsize=1)
+def _pdf_report_styles():
+    """ParagraphStyles del PDF del portafolio (ReportLab los reutiliza sin problema)."""
+    styles = getSampleStyleSheet()
+
+    # --- Custom Styles (Amazon-like Professional) ---
+    # Colors
+    AMZN_BLUE = colors.HexColor("#232F3E")
+    AMZN_LIGHT_BLUE = colors.HexColor("#37475A") 
+    AMZN_ORANGE = colors.HexColor("#FF9900")
+    DARK_GRAY = colors.HexColor("#333333")
+    LIGHT_GRAY = colors.HexColor("#EAEDED")
     
-    return charts
+    # Title
+    title_style = ParagraphStyle(
+        'AmznTitle',
+        parent=styles['Heading1'],
+        fontName='Helvetica-Bold',
+        fontSize=24,
+        textColor=AMZN_BLUE,
+        spaceAfter=12,
+        leading=28
+    )
+    
+    # Section Header
+    h1_style = ParagraphStyle(
+        'AmznH1',
+        parent=styles['Heading2'],
+        fontName='Helvetica-Bold',
+        fontSize=18,
+        textColor=AMZN_LIGHT_BLUE,
+        spaceBefore=20,
+        spaceAfter=10,
+        borderPadding=5,
+        borderColor=AMZN_ORANGE,
+        borderWidth=0,
+        borderBottomWidth=2
+    )
+    
+    # Sub Header
+    h2_style = ParagraphStyle(
+        'AmznH2',
+        parent=styles['Heading3'],
+        fontName='Helvetica-Bold',
+        fontSize=14,
+        textColor=DARK_GRAY,
+        spaceBefore=12,
+        spaceAfter=6
+    )
+    
+    # Normal Text
+    normal_style = ParagraphStyle(
+        'AmznNormal',
+        parent=styles['Normal'],
+        fontName='Helvetica',
+        fontSize=10,
+        textColor=DARK_GRAY,
+        leading=14
+    )
+    
+    # Big Number
+    big_num_style = ParagraphStyle(
+        'AmznBigNum', 
+        parent=styles['Normal'], 
+        fontName='Helvetica-Bold', 
+        fontSize=42, 
+        leading=48, 
+        textColor=colors.HexColor("#2563eb"), # Blue to match palette
+        alignment=1 # Center
+    )
+
+    header_text_style = ParagraphStyle('TableHeader', parent=normal_style, textColor=colors.white, fontName='Helvetica-Bold')
+
+    return {
+        "styles": styles,
+        "title": title_style,
+        "h1": h1_style,
+        "h2": h2_style,
+        "normal": normal_style,
+        "big_num": big_num_style,
+        "table_header": header_text_style,
+        "AMZN_BLUE": AMZN_BLUE,
+        "LIGHT_GRAY": LIGHT_GRAY,
+    }
+
+
+_PDF_PRIORITY_TEXT = {"1": "1: Critical", "2": "2: High", "3": "3: Medium"}
+
 
 @app.route("/api/dems/download/<fmt>", methods=["GET"])
 def dem_download(fmt):
     """Descarga el reporte como TXT / DOCX / PDF (solo DEMs activos)."""
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "No autorizado"}), 401
-
     fmt = fmt.lower()
     if fmt not in ("txt", "pdf", "docx"):
         return jsonify({"error": "Formato no soportado."}), 400
 
     dems = [d for d in load_dems() if not d.get("archived", False)]
-    text = build_portfolio_text(dems)
+    # (tipo, texto) por línea: TXT las une, DOCX/PDF despachan por tipo
+    lines = list(portfolio_lines(dems, active_dem_stats()))
+    text = "\n".join(line for _, line in lines)
     charts = generate_charts(dems)
 
-    lines = text.split("\n")
-    title = lines[0] if lines else "Andres Villanueva DEMS Report"
+    title = lines[0][1] if lines else "Andres Villanueva DEMS Report"
     
     # TXT (Simple dump)
     if fmt == "txt":
@@ -1563,23 +2083,20 @@ def dem_download(fmt):
         # Text Content
         doc.add_heading("2. Project Details", level=1)
         
-        # Parse the text report and add it nicely
-        # Skipping the first few lines which are the header/summary in the text version
+        # Add the report lines nicely, skipping the title/section headers of the text version
         start_details = False
-        for line in lines:
-            if "2. Projects Details" in line:
+        for kind, line in lines:
+            if kind == "details":
                 start_details = True
                 continue
             if not start_details:
-                if line.strip() and "1. Projects Resume" not in line and title not in line:
-                     doc.add_paragraph(line)
+                if kind not in ("blank", "title", "resume"):
+                    doc.add_paragraph(line)
                 continue
-            
-            if line.startswith("DEM:"):
-                doc.add_heading(line, level=2)
-            elif line.startswith("Last Notes"):
+
+            if kind == "notes_head":
                 doc.add_heading(line, level=3)
-            elif line.strip() == "-" * 78:
+            elif kind == "sep":
                 pass # Skip separators
             else:
                 doc.add_paragraph(line)
@@ -1609,75 +2126,15 @@ def dem_download(fmt):
             rightMargin=40, leftMargin=40, 
             topMargin=40, bottomMargin=40
         )
-        styles = getSampleStyleSheet()
         story = []
-        
-        # --- Custom Styles (Amazon-like Professional) ---
-        # Colors
-        AMZN_BLUE = colors.HexColor("#232F3E")
-        AMZN_LIGHT_BLUE = colors.HexColor("#37475A") 
-        AMZN_ORANGE = colors.HexColor("#FF9900")
-        AMZN_GREEN = colors.HexColor("#007600")
-        DARK_GRAY = colors.HexColor("#333333")
-        LIGHT_GRAY = colors.HexColor("#EAEDED")
-        
-        # Title
-        title_style = ParagraphStyle(
-            'AmznTitle',
-            parent=styles['Heading1'],
-            fontName='Helvetica-Bold',
-            fontSize=24,
-            textColor=AMZN_BLUE,
-            spaceAfter=12,
-            leading=28
-        )
-        
-        # Section Header
-        h1_style = ParagraphStyle(
-            'AmznH1',
-            parent=styles['Heading2'],
-            fontName='Helvetica-Bold',
-            fontSize=18,
-            textColor=AMZN_LIGHT_BLUE,
-            spaceBefore=20,
-            spaceAfter=10,
-            borderPadding=5,
-            borderColor=AMZN_ORANGE,
-            borderWidth=0,
-            borderBottomWidth=2
-        )
-        
-        # Sub Header
-        h2_style = ParagraphStyle(
-            'AmznH2',
-            parent=styles['Heading3'],
-            fontName='Helvetica-Bold',
-            fontSize=14,
-            textColor=DARK_GRAY,
-            spaceBefore=12,
-            spaceAfter=6
-        )
-        
-        # Normal Text
-        normal_style = ParagraphStyle(
-            'AmznNormal',
-            parent=styles['Normal'],
-            fontName='Helvetica',
-            fontSize=10,
-            textColor=DARK_GRAY,
-            leading=14
-        )
-        
-        # Big Number
-        big_num_style = ParagraphStyle(
-            'AmznBigNum', 
-            parent=styles['Normal'], 
-            fontName='Helvetica-Bold', 
-            fontSize=42, 
-            leading=48, 
-            textColor=colors.HexColor("#2563eb"), # Blue to match palette
-            alignment=1 # Center
-        )
+
+        # Estilos compartidos entre peticiones (se construyen una sola vez)
+        st = _pdf_report_styles()
+        styles = st["styles"]
+        title_style, h1_style, h2_style = st["title"], st["h1"], st["h2"]
+        normal_style, big_num_style = st["normal"], st["big_num"]
+        header_text_style = st["table_header"]
+        AMZN_BLUE, LIGHT_GRAY = st["AMZN_BLUE"], st["LIGHT_GRAY"]
 
         # --- Footer Function ---
         def add_footer(canvas, doc):
@@ -1729,29 +2186,23 @@ def dem_download(fmt):
         story.append(Spacer(1, 12))
 
         # Table Header
-        header_text_style = ParagraphStyle('TableHeader', parent=normal_style, textColor=colors.white, fontName='Helvetica-Bold')
         table_data = [[
             Paragraph("Project Name", header_text_style), 
             Paragraph("Priority", header_text_style),
             Paragraph("Latest Update", header_text_style)
         ]]
         
+        now = datetime.utcnow()
         for d in dems:
             name = d.get("name", "Unknown")
-            notes = d.get("notes", [])
+            e = enrich_dem(d, now)
             
             # Priority mapping
-            p_val = str(d.get("priority", "4"))
-            if p_val == "1": p_text = "1: Critical"
-            elif p_val == "2": p_text = "2: High"
-            elif p_val == "3": p_text = "3: Medium"
-            else: p_text = "4: Low"
-
-            if notes:
-                last_note_obj = notes[-1]
-                last_note_text = last_note_obj.get("text", "")
-                last_note_date = last_note_obj.get("date", "N/A")
-                full_comment = f"<b>{last_note_date}:</b> {last_note_text}"
+            p_text = _PDF_PRIORITY_TEXT.get(str(d.get("priority", "4")), "4: Low")
+
+            if e["notes"]:
+                # Campos precalculados (y cacheados) por enrich_dem
+                full_comment = f"<b>{e['last_note_date']}:</b> {e['last_note_text']}"
             else:
                 full_comment = "No updates recorded."
 
@@ -1793,39 +2244,27 @@ def dem_download(fmt):
         story.append(Paragraph("Detailed Project Report", h1_style))
         story.append(Spacer(1, 12))
         
-        # Parse text for details
+        # Details section, by line kind
         start_details = False
-        for line in lines:
-            if "2. Projects Details" in line:
+        for kind, line in lines:
+            if kind == "details":
                 start_details = True
                 continue
-            
+
             if not start_details:
                 continue
 
-            if line.startswith("Project:"):
+            if kind == "project":
                 story.append(Spacer(1, 16))
-                # Extract ID/Name if possible, or just print line
                 story.append(Paragraph(line, h1_style))
-            elif line.startswith("Last Notes"):
+            elif kind == "notes_head":
                 story.append(Paragraph(line, h2_style))
-            elif line.strip() == "-" * 78:
+            elif kind == "sep":
                 story.append(Spacer(1, 6))
-                # story.append(Paragraph("_" * 60, normal_style)) # Cleaner without separator lines
+            elif kind == "note":
+                story.append(Paragraph(line.strip(), styles["Bullet"], bulletText="•"))
             else:
-                # Handle bullet points
-                clean_line = line.strip()
-                if clean_line.startswith("- ") or clean_line.startswith("• "):
-                    story.append(Paragraph(clean_line, styles["Bullet"], bulletText="•"))
-                elif clean_line.startswith("Status:") or clean_line.startswith("Owner:"):
-                    # Bold labels
-                    parts = clean_line.split(":", 1)
-                    if len(parts) == 2:
-                        story.append(Paragraph(f"<b>{parts[0]}:</b> {parts[1]}", normal_style))
-                    else:
-                        story.append(Paragraph(clean_line, normal_style))
-                else:
-                    story.append(Paragraph(line, normal_style))
+                story.append(Paragraph(line, normal_style))
 
         doc.build(story, onFirstPage=add_footer, onLaterPages=add_footer)
         bio.seek(0)
@@ -1842,53 +2281,107 @@ def dem_download(fmt):
 
 # ---------------- AMD AI REPORTS ----------------
 
-def generate_amd_ai_report_logic(projects):
-    """
-    Generates a strategic report using OpenAI based on the provided projects.
-    Now includes document summaries in the context.
-    """
-    if not projects:
-        return "No active projects to analyze."
+AMD_REPORT_CHUNK = 15
+
+
+# Tope por proyecto del doc_summary en el prompt AMD: es el campo que domina
+# los tokens de entrada y con el inicio basta para el consejo estratégico.
+AMD_DOC_SUMMARY_MAX_CHARS = 600
 
-    # Build a context string from the projects
-    project_context = ""
+
+def _amd_project_context(projects):
+    """Bloque de texto por proyecto para los prompts del reporte AMD."""
+    parts = []
     for p in projects:
         name = p.get("name", "Unknown")
         title = p.get("title", "No Title")
         status = p.get("status", "Unknown")
         workflow = p.get("workflow_status", "Unknown")
         priority = p.get("priority", "N/A")
-        
+
         # Get document summary if available
         doc_summary = p.get("doc_summary", "No document summary available.")
-        
-        project_context += f"- Project: {name} | Title: {title}\n"
-        project_context += f"  Status: {status} | Workflow: {workflow} | Priority: {priority}\n"
-        project_context += f"  Document Summary: {doc_summary}\n"
-        project_context += "  ---\n"
-
-    system_prompt = (
-        "You are a Senior IT Strategic Advisor for AMD, specializing in SAP S/4HANA, Cloud Migrations, and Enterprise Architecture. "
-        "Your goal is to provide a high-level executive summary and actionable strategic advice for the following portfolio of projects.\n\n"
-        "Focus on providing REAL, USEFUL feedback:\n"
-        "1. CRITICAL RISK ASSESSMENT: Identify projects at risk based on status, priority, and lack of recent updates.\n"
-        "2. STRATEGIC ALIGNMENT: Suggest how these projects align with modern SAP/Cloud best practices.\n"
-        "3. ACCELERATION OPPORTUNITIES: Where can we move faster? What blockers can be removed?\n"
-        "4. TECHNICAL ADVICE: Use the Document Summaries to give specific technical recommendations.\n\n"
-        "IMPORTANT: Output the report as valid HTML code with inline CSS for styling. "
-        "Use a 'Cyberpunk' aesthetic: dark background is already provided by the container, so use transparent backgrounds. "
-        "Use colors like #00f3ff (Cyan), #ff00ff (Magenta), #fcee0a (Yellow), and #ff2a2a (Red). "
-        "Use font-family: 'Rajdhani', sans-serif for headers and 'Roboto Mono', monospace for text. "
-        "Format with <h2>, <h3>, <ul>, <li>, <p> tags. "
-        "Do NOT include <html>, <head>, or <body> tags, just the content div."
+        if isinstance(doc_summary, str) and len(doc_summary) > AMD_DOC_SUMMARY_MAX_CHARS:
+            doc_summary = doc_summary[:AMD_DOC_SUMMARY_MAX_CHARS].rstrip() + "…"
+
+        parts.append(
+            f"- Project: {name} | Title: {title}\n"
+            f"  Status: {status} | Workflow: {workflow} | Priority: {priority}\n"
+            f"  Document Summary: {doc_summary}\n"
+            "  ---\n"
+        )
+    return "".join(parts)
+
+
+def _amd_partial_summary(projects):
+    """Resumen intermedio (texto plano) de un lote de proyectos."""
+    completion = client.chat.completions.create(
+        model=DEFAULT_MODEL,
+        messages=[
+            {
+                "role": "system",
+                "content": (
+                    "You are a Senior IT Strategic Advisor. For the following batch of projects, "
+                    "write concise plain-text bullet points covering: risks (status, priority, "
+                    "stalled items), acceleration opportunities and key technical points from "
+                    "the Document Summaries. Mention each project by name. No HTML."
+                ),
+            },
+            {"role": "user", "content": _amd_project_context(projects)},
+        ],
+        max_tokens=700,
     )
+    return completion.choices[0].message.content.strip()
+
+
+AMD_REPORT_SYSTEM_PROMPT = (
+    "You are a Senior IT Strategic Advisor for AMD, specializing in SAP S/4HANA, Cloud Migrations, and Enterprise Architecture. "
+    "Your goal is to provide a high-level executive summary and actionable strategic advice for the following portfolio of projects.\n\n"
+    "Focus on providing REAL, USEFUL feedback:\n"
+    "1. CRITICAL RISK ASSESSMENT: Identify projects at risk based on status, priority, and lack of recent updates.\n"
+    "2. STRATEGIC ALIGNMENT: Suggest how these projects align with modern SAP/Cloud best practices.\n"
+    "3. ACCELERATION OPPORTUNITIES: Where can we move faster? What blockers can be removed?\n"
+    "4. TECHNICAL ADVICE: Use the Document Summaries to give specific technical recommendations.\n\n"
+    "IMPORTANT: Output the report as valid HTML code with inline CSS for styling. "
+    "Use a 'Cyberpunk' aesthetic: dark background is already provided by the container, so use transparent backgrounds. "
+    "Use colors like #00f3ff (Cyan), #ff00ff (Magenta), #fcee0a (Yellow), and #ff2a2a (Red). "
+    "Use font-family: 'Rajdhani', sans-serif for headers and 'Roboto Mono', monospace for text. "
+    "Format with <h2>, <h3>, <ul>, <li>, <p> tags. "
+    "Do NOT include <html>, <head>, or <body> tags, just the content div."
+)
+
+
+def generate_amd_ai_report_logic(projects):
+    """
+    Generates a strategic report using OpenAI based on the provided projects.
+    Now includes document summaries in the context.
+    """
+    if not projects:
+        return "No active projects to analyze."
 
     try:
+        if len(projects) <= AMD_REPORT_CHUNK:
+            user_content = f"Here is the project portfolio:\n\n{_amd_project_context(projects)}"
+        else:
+            # Map-reduce: lotes resumidos en paralelo y una síntesis final,
+            # así ningún prompt crece con el tamaño del portafolio
+            chunks = [
+                projects[i:i + AMD_REPORT_CHUNK]
+                for i in range(0, len(projects), AMD_REPORT_CHUNK)
+            ]
+            with ThreadPoolExecutor(max_workers=min(8, len(chunks))) as pool:
+                partials = list(pool.map(_amd_partial_summary, chunks))
+            user_content = (
+                f"The project portfolio ({len(projects)} projects) was pre-analyzed "
+                f"in {len(chunks)} batches. Partial analyses:\n\n"
+                + "\n---\n".join(partials)
+            )
+
         completion = client.chat.completions.create(
             model=DEFAULT_MODEL,
             messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Here is the project portfolio:\n\n{project_context}"}
+                {"role": "system", "content": AMD_REPORT_SYSTEM_PROMPT},
+                {"role": "user", "content": user_content}
             ],
             max_tokens=2000,
         )
@@ -1902,12 +2395,22 @@ def generate_amd_ai_report_logic(projects):
         return f"Error generating report: {str(e)}"
 
 
+_SAP_RE = re.compile("sap", re.IGNORECASE)
+
+
+def _mentions_sap(p):
+    """Check name, title, and notes for "SAP" (corta en la primera coincidencia)."""
+    if _SAP_RE.search(p.get("name") or "") or _SAP_RE.search(p.get("title") or ""):
+        return True
+    for n in p.get("notes") or []:
+        text = n.get("text", "") if isinstance(n, dict) else str(n)
+        if text and _SAP_RE.search(text):
+            return True
+    return False
+
+
 @app.route("/api/dems/report/ai", methods=["POST"])
 def amd_ai_report():
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "Unauthorized"}), 401
-
     data = request.get_json() or {}
     projects = data.get("projects", [])
 
@@ -1915,17 +2418,7 @@ def amd_ai_report():
         return jsonify({"error": "No projects provided for analysis."}), 400
 
     # Filter out SAP related projects
-    filtered_projects = []
-    for p in projects:
-        # Check name, title, and notes for "SAP"
-        text_content = (
-            (p.get("name") or "") + 
-            (p.get("title") or "") + 
-            " ".join([n.get("text", "") if isinstance(n, dict) else str(n) for n in p.get("notes", [])])
-        ).lower()
-        
-        if "sap" not in text_content:
-            filtered_projects.append(p)
+    filtered_projects = [p for p in projects if not _mentions_sap(p)]
 
     if not filtered_projects:
         return jsonify({"error": "No eligible projects found (SAP projects are excluded)."}), 400
@@ -1939,6 +2432,14 @@ def generate_ai_solution_analysis_logic(project):
     """
     Generates a comprehensive solution analysis for a single project.
     """
+    try:
+        return _solution_analysis_cached(_analysis_user_content(project))
+    except Exception as e:
+        _log(f"Error generating AI solution analysis: {e}")
+        return f"Error generating analysis: {str(e)}"
+
+
+def _analysis_user_content(project):
     name = project.get("name", "Unknown")
     title = project.get("title", "No Title")
     doc_summary = project.get("doc_summary", "No document summary available.")
@@ -1946,111 +2447,420 @@ def generate_ai_solution_analysis_logic(project):
     
     notes_text = "\n".join([n.get("text", "") if isinstance(n, dict) else str(n) for n in notes][-5:])
 
-    system_prompt = (
-        "You are an Expert Solution Architect. "
-        "Analyze the following project request and provide a comprehensive solution analysis.\n"
-        "Include:\n"
-        "1. Problem Statement Analysis\n"
-        "2. Proposed Solution Architecture (High Level)\n"
-        "3. Key Technical Components (SAP modules, Cloud services, etc.)\n"
-        "4. Implementation Steps & Risks\n\n"
-        "Use the Document Summary as the primary source of requirements.\n\n"
-        "IMPORTANT: Output the report as valid HTML code with inline CSS for styling. "
-        "Use a 'Cyberpunk' aesthetic: dark background is already provided by the container, so use transparent backgrounds. "
-        "Use colors like #00f3ff (Cyan), #ff00ff (Magenta), #fcee0a (Yellow), and #ff2a2a (Red). "
-        "Use font-family: 'Rajdhani', sans-serif for headers and 'Roboto Mono', monospace for text. "
-        "Format with <h2>, <h3>, <ul>, <li>, <p> tags. "
-        "Do NOT include <html>, <head>, or <body> tags, just the content div."
-    )
-    
-    user_content = (
+    return (
         f"Project: {name} - {title}\n"
         f"Document Summary: {doc_summary}\n"
         f"Recent Notes: {notes_text}\n"
     )
 
+
+SOLUTION_ANALYSIS_SYSTEM_PROMPT = (
+    "You are an Expert Solution Architect. "
+    "Analyze the following project request and provide a comprehensive solution analysis.\n"
+    "Include:\n"
+    "1. Problem Statement Analysis\n"
+    "2. Proposed Solution Architecture (High Level)\n"
+    "3. Key Technical Components (SAP modules, Cloud services, etc.)\n"
+    "4. Implementation Steps & Risks\n\n"
+    "Use the Document Summary as the primary source of requirements.\n\n"
+    "IMPORTANT: Output the report as valid HTML code with inline CSS for styling. "
+    "Use a 'Cyberpunk' aesthetic: dark background is already provided by the container, so use transparent backgrounds. "
+    "Use colors like #00f3ff (Cyan), #ff00ff (Magenta), #fcee0a (Yellow), and #ff2a2a (Red). "
+    "Use font-family: 'Rajdhani', sans-serif for headers and 'Roboto Mono', monospace for text. "
+    "Format with <h2>, <h3>, <ul>, <li>, <p> tags. "
+    "Do NOT include <html>, <head>, or <body> tags, just the content div."
+)
+
+
+# Prefijo estable (system prompt idéntico en cada llamada): OpenAI reutiliza
+# su caché de prompt. La clave agrupa estas peticiones en la misma caché;
+# va en extra_body para no depender de la versión del SDK.
+SOLUTION_ANALYSIS_CACHE_KEY = "dems-solution-analysis-v1"
+
+
+# Presupuesto de tokens: la mayoría de análisis caben en el corto; solo los
+# cortados por longitud (finish_reason == "length") llegan al largo.
+ANALYSIS_MAX_TOKENS = 900
+ANALYSIS_MAX_TOKENS_LONG = 1500
+ANALYSIS_CONTINUE_PROMPT = "Continue exactly where you stopped. Do not repeat anything already written."
+
+
+def _analysis_messages(user_content):
+    return [
+        {"role": "system", "content": SOLUTION_ANALYSIS_SYSTEM_PROMPT},
+        {"role": "user", "content": user_content}
+    ]
+
+
+def _strip_code_fences(content):
+    # Robustly strip markdown code blocks
+    return content.replace("```html", "").replace("```", "").strip()
+
+
+# Análisis ya generados, por prompt exacto (LRU). Lo comparten la respuesta
+# JSON y la de streaming, así un DEM sin cambios no vuelve a llamar a OpenAI.
+_ANALYSIS_CACHE = OrderedDict()
+_ANALYSIS_CACHE_MAX = 512
+_ANALYSIS_CACHE_LOCK = threading.Lock()
+# Análisis en curso por prompt: peticiones simultáneas del mismo DEM esperan
+# el Future de la primera en vez de lanzar otra llamada a OpenAI.
+_ANALYSIS_INFLIGHT = {}
+
+
+def _analysis_claim(user_content):
+    """
+    (cached, future, leader): el análisis ya hecho, o el Future a esperar.
+    Si leader es True el llamador debe generarlo y cerrar con _analysis_finish.
+    """
+    with _ANALYSIS_CACHE_LOCK:
+        content = _ANALYSIS_CACHE.get(user_content)
+        if content is not None:
+            _ANALYSIS_CACHE.move_to_end(user_content)
+            return content, None, False
+        future = _ANALYSIS_INFLIGHT.get(user_content)
+        if future is not None:
+            return None, future, False
+        future = _ANALYSIS_INFLIGHT[user_content] = Future()
+        return None, future, True
+
+
+# Copia en disco de los análisis: la comparten los workers de gunicorn y
+# sobrevive a reinicios. La clave incluye modelo y versión del prompt.
+ANALYSIS_CACHE_DIR = os.path.join(BASE_DIR, "analysis_cache")
+ANALYSIS_CACHE_TTL = 30 * 24 * 3600
+
+
+def _analysis_disk_path(user_content):
+    key = f"{DEFAULT_MODEL}\n{SOLUTION_ANALYSIS_CACHE_KEY}\n{user_content}"
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return os.path.join(ANALYSIS_CACHE_DIR, digest + ".html")
+
+
+def _analysis_disk_get(user_content):
+    path = _analysis_disk_path(user_content)
     try:
-        completion = client.chat.completions.create(
-            model=DEFAULT_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_content}
-            ],
-            max_tokens=1500,
-        )
-        content = completion.choices[0].message.content
-        # Robustly strip markdown code blocks
-        content = content.replace("```html", "").replace("```", "").strip()
+        if time.time() - os.stat(path).st_mtime > ANALYSIS_CACHE_TTL:
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _analysis_disk_put(user_content, content):
+    try:
+        os.makedirs(ANALYSIS_CACHE_DIR, exist_ok=True)
+        # Temporal + os.replace: otro worker nunca lee un archivo a medias
+        fd, tmp = tempfile.mkstemp(dir=ANALYSIS_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp, _analysis_disk_path(user_content))
+    except OSError as e:
+        _log(f"Error writing analysis cache: {e}")
+
+
+def _analysis_finish(user_content, future, content=None, error=None):
+    with _ANALYSIS_CACHE_LOCK:
+        _ANALYSIS_INFLIGHT.pop(user_content, None)
+        if error is None:
+            _ANALYSIS_CACHE[user_content] = content
+            if len(_ANALYSIS_CACHE) > _ANALYSIS_CACHE_MAX:
+                _ANALYSIS_CACHE.popitem(last=False)
+    if error is None:
+        future.set_result(content)
+    else:
+        future.set_exception(error)
+
+
+def _solution_analysis_cached(user_content):
+    """
+    Análisis completo (bloqueante). Los errores se propagan y no se cachean.
+    """
+    content, future, leader = _analysis_claim(user_content)
+    if leader:
+        content = _analysis_disk_get(user_content)
+        if content is not None:
+            _analysis_finish(user_content, future, content)
+    if content is not None:
         return content
+    if not leader:
+        return future.result()
+    try:
+        for max_tokens in (ANALYSIS_MAX_TOKENS, ANALYSIS_MAX_TOKENS_LONG):
+            completion = client.chat.completions.create(
+                model=DEFAULT_MODEL,
+                messages=_analysis_messages(user_content),
+                max_tokens=max_tokens,
+                extra_body={"prompt_cache_key": SOLUTION_ANALYSIS_CACHE_KEY},
+            )
+            choice = completion.choices[0]
+            if choice.finish_reason != "length":
+                break
+        content = _strip_code_fences(choice.message.content)
     except Exception as e:
-        _log(f"Error generating AI solution analysis: {e}")
-        return f"Error generating analysis: {str(e)}"
+        _analysis_finish(user_content, future, error=e)
+        raise
+    _analysis_disk_put(user_content, content)
+    _analysis_finish(user_content, future, content)
+    return content
+
+
+def _solution_analysis_stream(user_content):
+    """
+    Eventos SSE con el análisis a medida que OpenAI genera tokens. El texto
+    llega crudo (el cliente quita los ```); al terminar se guarda en caché.
+    """
+    content, future, leader = _analysis_claim(user_content)
+    if leader:
+        content = _analysis_disk_get(user_content)
+        if content is not None:
+            _analysis_finish(user_content, future, content)
+    if content is not None:
+        yield _sse_event({"delta": content})
+    elif not leader:
+        # Otra petición ya lo está generando: se envía completo al terminar
+        try:
+            yield _sse_event({"delta": future.result()})
+        except Exception as e:
+            yield _sse_event({"error": f"Error generating analysis: {str(e)}"})
+    else:
+        error = None
+        parts = []
+        try:
+            # Lo ya enviado no se puede rehacer: si se corta por longitud se pide
+            # la continuación con el resto del presupuesto (mismo total que antes)
+            messages = _analysis_messages(user_content)
+            budgets = (ANALYSIS_MAX_TOKENS, ANALYSIS_MAX_TOKENS_LONG - ANALYSIS_MAX_TOKENS)
+            for max_tokens in budgets:
+                stream = client.chat.completions.create(
+                    model=DEFAULT_MODEL,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    extra_body={"prompt_cache_key": SOLUTION_ANALYSIS_CACHE_KEY},
+                    stream=True,
+                    stream_options={"include_usage": False},
+                )
+                finish_reason = None
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    choice = chunk.choices[0]
+                    delta = choice.delta.content
+                    if delta is not None:
+                        parts.append(delta)
+                        yield _sse_event({"delta": delta})
+                    if choice.finish_reason:
+                        finish_reason = choice.finish_reason
+                if finish_reason != "length":
+                    break
+                messages = messages + [
+                    {"role": "assistant", "content": "".join(parts)},
+                    {"role": "user", "content": ANALYSIS_CONTINUE_PROMPT},
+                ]
+        except Exception as e:
+            error = e
+            _log(f"Error generating AI solution analysis: {e}")
+            yield _sse_event({"error": f"Error generating analysis: {str(e)}"})
+        except GeneratorExit:
+            # Cliente desconectado a mitad: liberar a quien esté esperando
+            error = RuntimeError("Analysis stream cancelled")
+            raise
+        finally:
+            if error is None:
+                content = _strip_code_fences("".join(parts))
+                _analysis_disk_put(user_content, content)
+                _analysis_finish(user_content, future, content)
+            else:
+                _analysis_finish(user_content, future, error=error)
+    yield "event: done\ndata: {}\n\n"
+
 
 @app.route("/api/dems/project/<project_id>/analysis", methods=["POST"])
 def generate_ai_solution_analysis(project_id):
-    maybe = require_auth()
-    if maybe: return maybe
-    
-    projects = load_dems()
-    project = next((p for p in projects if p.get("id") == project_id), None)
+    project = get_dem(project_id)
     
     if not project:
         return jsonify({"error": "Project not found"}), 404
+
+    # Accept: text/event-stream -> tokens según se generan; si no, JSON como antes
+    if "text/event-stream" in request.headers.get("Accept", ""):
+        return Response(
+            stream_with_context(_solution_analysis_stream(_analysis_user_content(project))),
+            mimetype="text/event-stream",
+            headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"},
+        )
         
     analysis = generate_ai_solution_analysis_logic(project)
     return jsonify({"analysis": analysis})
 
+
+# Tope de DEMs por lote: tamaño del pool x 4, para que una sola petición no
+# encole un número arbitrario de llamadas a OpenAI.
+ANALYSIS_BATCH_WORKERS = 8
+ANALYSIS_BATCH_MAX = ANALYSIS_BATCH_WORKERS * 4
+
+
+@app.route("/api/dems/projects/analysis_batch", methods=["POST"])
+def generate_ai_solution_analysis_batch():
+    """
+    Análisis de solución para varios DEMs en una sola petición.
+
+    Body: {"project_ids": [...]} (ids string, como mucho ANALYSIS_BATCH_MAX).
+    Las llamadas a OpenAI van en paralelo (mismo pool acotado que /upload),
+    así la latencia total ≈ la más lenta. Ningún frontend la usa todavía:
+    dem_manager.html pide el análisis DEM por DEM.
+    """
+    data = request.get_json() or {}
+    ids = data.get("project_ids") or []
+    if not isinstance(ids, list) or not ids:
+        return jsonify({"error": "No projects provided for analysis."}), 400
+    if not all(isinstance(i, str) for i in ids):
+        return jsonify({"error": "project_ids must be a list of strings."}), 400
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > ANALYSIS_BATCH_MAX:
+        return jsonify(
+            {"error": f"Too many projects: at most {ANALYSIS_BATCH_MAX} per request."}
+        ), 400
+
+    projects = [p for p in map(get_dem, ids) if p is not None]
+    if not projects:
+        return jsonify({"error": "Project not found"}), 404
+
+    with ThreadPoolExecutor(max_workers=min(ANALYSIS_BATCH_WORKERS, len(projects))) as pool:
+        analyses = list(pool.map(generate_ai_solution_analysis_logic, projects))
+
+    return jsonify(
+        {"analyses": {p.get("id"): a for p, a in zip(projects, analyses)}}
+    )
+
+
+# Último listado de UPLOAD_FOLDER, válido mientras no cambie el mtime del
+# directorio: altas (os.replace), bajas y renombres lo cambian, y lo ven todos
+# los workers. Un mtime de hace menos de FILES_LISTING_SETTLE_NS no se usa
+# como clave (otro cambio en el mismo tick del sistema de archivos no lo movería).
+FILES_LISTING_SETTLE_NS = 2_000_000_000
+_FILES_LISTING = {"mtime": None, "v": None}
+
+
+def _scan_upload_folder():
+    """(files, etag, last_modified_ns) del directorio de subidas."""
+    files = []
+    # Firma del listado: mtime del directorio (altas/bajas/renombres) + nº,
+    # tamaño total y mtime máximo de los archivos (contenido reescrito)
+    dir_mtime = max_mtime = total_size = 0
+    if os.path.exists(UPLOAD_FOLDER):
+        dir_mtime = os.stat(UPLOAD_FOLDER).st_mtime_ns
+        # Locales para el bucle: sin búsquedas de atributo por archivo
+        append = files.append
+        strftime = time.strftime
+        localtime = time.localtime
+        # scandir: tipo de entrada sin stat extra; un solo stat por archivo
+        with os.scandir(UPLOAD_FOLDER) as entries:
+            for entry in entries:
+                # Un archivo ilegible (borrado a mitad, permisos) no tumba el listado
+                try:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                size = stat.st_size
+                total_size += size
+                if stat.st_mtime_ns > max_mtime:
+                    max_mtime = stat.st_mtime_ns
+                size_mb = round(size / 1048576, 2)
+                # struct_time directo: sin construir un datetime por archivo
+                date_str = strftime('%Y-%m-%d %H:%M', localtime(stat.st_mtime))
+                append({
+                    "name": entry.name,
+                    "size": f"{size_mb} MB",
+                    "date": date_str
+                })
+    etag = f"{dir_mtime:x}-{len(files):x}-{total_size:x}-{max_mtime:x}"
+    return files, etag, max(dir_mtime, max_mtime)
+
+
 @app.route("/api/files", methods=["GET"])
 def list_files():
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "Unauthorized"}), 401
-    
+    listing = _FILES_LISTING["v"]
+    stale = False
     try:
-        files = []
-        if os.path.exists(UPLOAD_FOLDER):
-            for f in os.listdir(UPLOAD_FOLDER):
-                path = os.path.join(UPLOAD_FOLDER, f)
-                if os.path.isfile(path):
-                    stat = os.stat(path)
-                    size_mb = round(stat.st_size / (1024 * 1024), 2)
-                    date_str = datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M')
-                    files.append({
-                        "name": f,
-                        "size": f"{size_mb} MB",
-                        "date": date_str
-                    })
-        return jsonify({"files": files})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        dir_mtime = os.stat(UPLOAD_FOLDER).st_mtime_ns
+    except OSError:
+        dir_mtime = None
+    if listing is None or dir_mtime is None or dir_mtime != _FILES_LISTING["mtime"]:
+        try:
+            listing = _scan_upload_folder()
+            settled = (
+                dir_mtime is not None
+                and time.time_ns() - dir_mtime >= FILES_LISTING_SETTLE_NS
+            )
+            _FILES_LISTING["mtime"] = dir_mtime if settled else None
+            _FILES_LISTING["v"] = listing
+        except Exception as e:
+            if listing is None:
+                return jsonify({"error": str(e)}), 500
+            # Error de disco: mejor el último listado bueno que un 500
+            _log(f"Error listing uploads, serving cached listing: {e}")
+            stale = True
+
+    files, etag, last = listing
+    # ETag débil + Last-Modified: si nada cambió, 304 sin cuerpo
+    resp = jsonify({"files": files})
+    resp.set_etag(etag, weak=True)
+    if last:
+        resp.last_modified = datetime.utcfromtimestamp(last // 1_000_000_000)
+    resp.headers["Cache-Control"] = "no-cache"
+    if stale:
+        resp.headers["X-Cache"] = "stale"
+    return resp.make_conditional(request)
 
 @app.route("/api/files/<filename>", methods=["GET"])
 def download_file(filename):
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "Unauthorized"}), 401
-    
+    if ACCEL_REDIRECT_PREFIX:
+        path = safe_join(UPLOAD_FOLDER, filename)
+        if path is None or not os.path.isfile(path):
+            return jsonify({"error": "File not found"}), 404
+        resp = Response()
+        resp.headers["X-Accel-Redirect"] = ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + quote(filename)
+        resp.headers.set("Content-Disposition", "attachment", filename=filename)
+        # Sin Content-Type: nginx lo deduce de la extensión (mime.types)
+        del resp.headers["Content-Type"]
+        return resp
+
     try:
-        return send_from_directory(UPLOAD_FOLDER, filename, as_attachment=True)
+        # conditional/etag: 304 y Range; el servidor WSGI usa sendfile vía file_wrapper
+        resp = send_from_directory(
+            UPLOAD_FOLDER,
+            filename,
+            as_attachment=True,
+            conditional=True,
+            etag=True,
+        )
     except Exception as e:
         return jsonify({"error": str(e)}), 404
+    # Archivos de usuarios tras login: nada de caches compartidas, y el
+    # navegador revalida siempre con el ETag (una resubida se ve al instante)
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp
 
 @app.route("/api/files/<filename>/delete", methods=["POST"])
 def delete_file(filename):
-    maybe = require_auth()
-    if maybe is not None:
-        return jsonify({"error": "Unauthorized"}), 401
-    
+    # safe_join: None si el nombre escapa de UPLOAD_FOLDER ("..", rutas absolutas)
+    path = safe_join(UPLOAD_FOLDER, filename)
+    if path is None:
+        return jsonify({"error": "File not found"}), 404
+    # Un solo unlink (EAFP): sin exists() previo ni carrera entre ambos
     try:
-        path = os.path.join(UPLOAD_FOLDER, filename)
-        if os.path.exists(path):
-            os.remove(path)
-            return jsonify({"success": True})
-        else:
-            return jsonify({"error": "File not found"}), 404
+        os.unlink(path)
+        return jsonify({"success": True})
+    except FileNotFoundError:
+        return jsonify({"error": "File not found"}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8080)
+    # Solo desarrollo; en el contenedor sirve gunicorn (ver Dockerfile)
+    app.run(host="0.0.0.0", port=8080, threaded=True)